@@ -0,0 +1,307 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from dataset import COLUMN_SCHEMA, DERIVED_SCHEMA
+
+try:
+    import duckdb
+except ImportError:  # the DuckDB backend is optional
+    duckdb = None
+
+SCHEMA = {**COLUMN_SCHEMA, **DERIVED_SCHEMA}
+
+# columns the bookings can be grouped and filtered by
+DIMENSIONS = [column for column, kind in SCHEMA.items() if kind == "category"] + [
+    "is_canceled",
+    "arrival_date_year",
+    "arrival_date_week_number",
+    "arrival_date_day_of_month",
+]
+
+# columns the metrics can be computed on
+MEASURES = [column for column, kind in SCHEMA.items() if kind in ("integer", "float")]
+
+# metric functions: "count" counts the bookings, the others take a measure: "sum:adr"
+FUNCTIONS = ["sum", "mean", "min", "max"]
+
+
+class AggregationError(ValueError):
+    """
+    Raised for a group-by column, filter or metric outside the whitelist.
+    """
+
+
+def _parse_filter(value: str) -> tuple:
+    column, separator, item = value.partition(":")
+    if not separator or column not in DIMENSIONS:
+        raise AggregationError(
+            f"Invalid filter {value!r}: expected column:value, column one of {DIMENSIONS}"
+        )
+    return column, item
+
+
+def _parse_metric(value: str) -> str:
+    if value == "count":
+        return value
+    function, separator, measure = value.partition(":")
+    if not separator or function not in FUNCTIONS or measure not in MEASURES:
+        raise AggregationError(
+            f"Invalid metric {value!r}: expected count or function:column, "
+            f"function one of {FUNCTIONS}, column one of {MEASURES}"
+        )
+    return value
+
+
+def normalize_query(
+    group_by: list,
+    filters: list,
+    metrics: list,
+    order_by: list = None,
+    limit: int = None,
+) -> dict:
+    """
+    Validates an aggregation query against the whitelists and returns its normalized form:
+    group-by columns and metrics without repeats, in the given order, and filter values sorted by column,
+    so equal queries written differently share one cached result.
+    The rows are ordered by the order_by keys, group-by columns or metrics of the query,
+    descending with a leading "-" ("-count"), then by the group-by columns; limit keeps the first rows.
+    """
+    for column in group_by:
+        if column not in DIMENSIONS:
+            raise AggregationError(
+                f"Invalid group_by {column!r}: expected one of {DIMENSIONS}"
+            )
+
+    values = {}
+    for value in filters:
+        column, item = _parse_filter(value)
+        values.setdefault(column, set()).add(item)
+
+    metrics = [_parse_metric(metric) for metric in metrics] or ["count"]
+
+    keys = group_by + metrics
+    for key in order_by or []:
+        if key.removeprefix("-") not in keys:
+            raise AggregationError(
+                f"Invalid order_by {key!r}: expected one of {keys}, with a leading - for descending"
+            )
+
+    if limit is not None and limit < 1:
+        raise AggregationError(f"Invalid limit {limit}: expected a positive number")
+
+    return {
+        "group_by": list(dict.fromkeys(group_by)),
+        "filters": {column: sorted(values[column]) for column in sorted(values)},
+        "metrics": list(dict.fromkeys(metrics)),
+        "order_by": list(dict.fromkeys(order_by or [])),
+        "limit": limit,
+    }
+
+
+def query_key(query: dict, version: str) -> str:
+    """
+    Returns the cache key of a normalized query for one version of the dataset.
+    """
+    digest = hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    return f"aggregate:{version}:{digest}"
+
+
+def _filter_mask(df: pd.DataFrame, filters: dict) -> np.ndarray:
+    # values of several filters on one column are alternatives, the columns are combined
+    mask = np.ones(len(df), dtype=bool)
+    for column, items in filters.items():
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # compare the few categories as text, then the rows by category
+            categories = series.cat.categories
+            matched = categories[categories.astype(str).isin(items)]
+            mask &= series.isin(matched).to_numpy()
+        else:
+            try:
+                numbers = [int(item) for item in items]
+            except ValueError:
+                raise AggregationError(f"Invalid filter value for {column}: {items}")
+            mask &= series.isin(numbers).to_numpy()
+    return mask
+
+
+def metric_name(metric: str) -> str:
+    """
+    Returns the key of a metric in the rows of a query: count, sum_adr...
+    """
+    return metric.replace(":", "_")
+
+
+def _order(key: str) -> tuple:
+    # the result column of an order_by key, and whether it is descending
+    return metric_name(key.removeprefix("-")), key.startswith("-")
+
+
+def aggregate(df: pd.DataFrame, query: dict) -> list:
+    """
+    Computes a normalized aggregation query: one boolean mask for the filters
+    and one groupby pass for all the metrics.
+
+    return: list of dicts with the group-by columns and one key per metric: count, sum_adr, mean_lead_time...
+    """
+    if query["filters"]:
+        frame = df[_filter_mask(df, query["filters"])]
+    else:
+        # no filter: the groupby reads the columns it needs, the frame is not copied
+        frame = df
+
+    aggregations = {}
+    for metric in query["metrics"]:
+        if metric == "count":
+            aggregations["count"] = ("hotel", "size")
+        else:
+            function, measure = metric.split(":")
+            aggregations[metric_name(metric)] = (measure, function)
+
+    if query["group_by"]:
+        result = (
+            frame.groupby(query["group_by"], observed=True)
+            .agg(**aggregations)
+            .reset_index()
+        )
+    else:
+        # no group-by: a single row over all the filtered bookings
+        result = pd.DataFrame(
+            [
+                {
+                    name: (
+                        len(frame)
+                        if function == "size"
+                        else frame[column].agg(function)
+                    )
+                    for name, (column, function) in aggregations.items()
+                }
+            ]
+        )
+
+    if query["order_by"]:
+        # a stable sort: ties stay in the order of the group-by columns
+        columns, descending = zip(*map(_order, query["order_by"]))
+        result = result.sort_values(
+            list(columns),
+            ascending=[not item for item in descending],
+            kind="stable",
+            na_position="last",
+        )
+    if query["limit"] is not None:
+        result = result.head(query["limit"])
+
+    return _records(result)
+
+
+def _records(result: pd.DataFrame) -> list:
+    # missing values (a mean over no bookings) are returned as null
+    result = result.astype(object).where(result.notna(), None)
+    return result.to_dict("records")
+
+
+class PandasBackend:
+    """
+    Runs the aggregation queries with pandas, in the calling thread.
+    """
+
+    name = "pandas"
+
+    def aggregate(self, df: pd.DataFrame, query: dict) -> list:
+        return aggregate(df, query)
+
+
+class DuckDBBackend:
+    """
+    Runs the aggregation queries with DuckDB: the query is compiled to one SQL GROUP BY,
+    executed on all cores over the columns of the DataFrame, scanned in place.
+    The DataFrame stays the source of the data, so appends and reloads apply to both backends.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, threads: int = None):
+        if duckdb is None:
+            raise ValueError("The duckdb analytics backend needs duckdb installed")
+        self._connection = duckdb.connect()
+        if threads:
+            self._connection.execute(f"SET threads = {int(threads)}")
+
+    def _select(self, metric: str) -> str:
+        if metric == "count":
+            return "COUNT(*) AS count"
+        function, measure = metric.split(":")
+        sql = f'{function.upper()}("{measure}")'
+        # sums of integers are returned as integers, like pandas does
+        if function == "sum" and SCHEMA[measure] == "integer":
+            sql = f"CAST({sql} AS BIGINT)"
+        return f'{sql} AS "{metric_name(metric)}"'
+
+    def compile(self, query: dict) -> tuple:
+        """
+        Returns the SQL of a normalized query over the "bookings" view, and its parameters.
+        """
+        columns = [f'"{column}"' for column in query["group_by"]]
+        conditions, parameters = [], []
+        for column, items in query["filters"].items():
+            if SCHEMA[column] == "category":
+                conditions.append(
+                    f'CAST("{column}" AS VARCHAR) IN ({", ".join("?" * len(items))})'
+                )
+                parameters.extend(items)
+            else:
+                try:
+                    numbers = [int(item) for item in items]
+                except ValueError:
+                    raise AggregationError(
+                        f"Invalid filter value for {column}: {items}"
+                    )
+                conditions.append(f'"{column}" IN ({", ".join("?" * len(items))})')
+                parameters.extend(numbers)
+        # pandas leaves the bookings with a missing group-by value out of the groups
+        conditions.extend(f"{column} IS NOT NULL" for column in columns)
+
+        sql = "SELECT " + ", ".join(
+            columns + [self._select(metric) for metric in query["metrics"]]
+        )
+        sql += " FROM bookings"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if columns:
+            sql += f" GROUP BY {', '.join(columns)}"
+        # the order of pandas: the order_by keys, then the group-by columns
+        order = [
+            f'"{column}" {"DESC" if descending else "ASC"} NULLS LAST'
+            for column, descending in map(_order, query["order_by"])
+        ]
+        if order or columns:
+            sql += " ORDER BY " + ", ".join(order + columns)
+        if query["limit"] is not None:
+            sql += f" LIMIT {int(query['limit'])}"
+        return sql, parameters
+
+    def aggregate(self, df: pd.DataFrame, query: dict) -> list:
+        sql, parameters = self.compile(query)
+        # a cursor per call: the queries run concurrently from the worker pool
+        cursor = self._connection.cursor()
+        try:
+            cursor.register("bookings", df)
+            result = cursor.execute(sql, parameters).df()
+        finally:
+            cursor.close()
+
+        return _records(result)
+
+
+def create_backend(backend: str, threads: int = None):
+    """
+    Returns the analytics backend chosen in the settings: "pandas" or "duckdb".
+    """
+    if backend == "pandas":
+        return PandasBackend()
+    if backend == "duckdb":
+        return DuckDBBackend(threads)
+    raise ValueError(f"Unknown analytics backend: {backend}")
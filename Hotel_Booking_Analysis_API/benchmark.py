@@ -0,0 +1,222 @@
+"""
+Latency benchmark of the API under concurrent mixed traffic.
+
+The application is driven in-process through an ASGI client, so the numbers show
+how the event loop copes with slow requests running next to fast ones.
+Unless --cache is given, every request to a route of the response cache gets a distinct
+query parameter, so the heavy requests run their handlers instead of being served from the cache.
+
+The serialization mode times the encoding of list responses alone: the default
+FastAPI path (validation, jsonable_encoder, json) against the fast responses.
+
+The analytics mode times the analytics backends on the queries of the analytics endpoints,
+on the dataset repeated 1, 10 and 100 times: pandas, DuckDB on one thread and on all cores.
+That the backends return the results of the endpoints is checked by tests/test_analytics.py.
+
+Usage:
+    python benchmark.py --requests 2000 --concurrency 32
+    python benchmark.py --requests 2000 --concurrency 32 --cache
+    python benchmark.py --serialization
+    python benchmark.py --analytics --scales 1 10 100
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+import aggregation
+import main as api
+import serialization
+from database import Booking, async_db_engine, db_engine
+from main import app
+from schemas import BookingAllResponse
+
+# mix of fast lookups and heavy DataFrame and database requests
+MIXED_TRAFFIC = [
+    ("/bookings/1", {}),
+    ("/bookings", {"skip": 100, "limit": 100}),
+    ("/bookings/stats/", {}),
+    ("/bookings/top_countries/", {}),
+    ("/bookings/search/", {"guest_name": "Jamie Smith"}),
+    ("/bookings/nationality/", {"nationality": "PRT"}),
+]
+
+# fast request used to measure how much the heavy ones stall the event loop
+PROBE = ("/bookings/1", {})
+
+# queries of the analytics endpoints, as /bookings/aggregate/ queries: group_by, filters, metrics
+ANALYTICS_QUERIES = {
+    "revenue by hotel, month": (["hotel", "arrival_date_month"], [], ["sum:adr"]),
+    "count by hotel, meal": (["hotel", "meal"], [], ["count"]),
+    "guests by year": (
+        ["arrival_date_year"],
+        [],
+        ["sum:adults", "sum:children", "sum:babies"],
+    ),
+    "bookings by country": (["country"], [], ["count"]),
+    "resort revenue by country": (["country"], ["hotel:Resort Hotel"], ["sum:adr"]),
+    "repeated guests by hotel": (
+        ["hotel"],
+        ["is_repeated_guest:1"],
+        ["count", "mean:length_of_stay", "max:adr"],
+    ),
+}
+
+
+def _bust_cache(requests: list) -> list:
+    # an unknown query parameter is ignored by the routes, but changes the key of the response cache
+    return [
+        (path, {**params, "nocache": number} if path in api.CACHED_PATHS else params)
+        for number, (path, params) in enumerate(requests)
+    ]
+
+
+async def _timed_get(client: httpx.AsyncClient, path: str, params: dict) -> float:
+    start = time.perf_counter()
+    response = await client.get(path, params=params)
+    response.read()
+    return time.perf_counter() - start
+
+
+async def _run(requests: list, concurrency: int) -> dict:
+    latencies = {}
+    queue = iter(requests)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+    ) as client:
+
+        async def worker():
+            for path, params in queue:
+                latency = await _timed_get(client, path, params)
+                latencies.setdefault(path, []).append(latency)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    # the pooled connections belong to this event loop
+    await async_db_engine.dispose()
+    return latencies
+
+
+def _report(title: str, latencies: dict) -> None:
+    print(title)
+    for path, values in sorted(latencies.items()):
+        values = np.array(values) * 1000
+        print(
+            f"  {path:40} n={len(values):6}  p50={np.percentile(values, 50):8.2f} ms"
+            f"  p99={np.percentile(values, 99):8.2f} ms"
+        )
+
+
+def _time_encoder(encode, data, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(data)
+    return (time.perf_counter() - start) / repeat
+
+
+def _serialization(repeat: int) -> None:
+    model = list[BookingAllResponse]
+    adapter = TypeAdapter(model)
+
+    encoders = {
+        "fastapi": lambda data: json.dumps(
+            jsonable_encoder(adapter.validate_python(data))
+        ).encode(),
+        "pydantic-core": lambda data: adapter.dump_json(adapter.validate_python(data)),
+    }
+    if serialization.orjson is not None:
+        encoders["orjson"] = lambda data: serialization.orjson.dumps(
+            data, option=serialization.orjson.OPT_SERIALIZE_NUMPY
+        )
+
+    print("serialization of bookings:")
+    for rows in (100, 10_000):
+        query = select(*Booking.__table__.columns).order_by(Booking.id).limit(rows)
+        with db_engine.connect() as connection:
+            data = [dict(row) for row in connection.execute(query).mappings()]
+        for name, encode in encoders.items():
+            seconds = _time_encoder(encode, data, repeat)
+            print(f"  {rows:6} rows  {name:14} {seconds * 1000:10.2f} ms")
+
+
+def _analytics(scales: list, repeat: int) -> None:
+    df = api.dataset.df
+    queries = {
+        name: aggregation.normalize_query(*query)
+        for name, query in ANALYTICS_QUERIES.items()
+    }
+    backends = {
+        "pandas": aggregation.PandasBackend(),
+        "duckdb 1 thread": aggregation.DuckDBBackend(threads=1),
+        "duckdb": aggregation.DuckDBBackend(),
+    }
+
+    # scaling: only the columns of the queries are repeated, to bound the memory
+    columns = sorted(
+        {column for query in queries.values() for column in query["group_by"]}
+        | {column for query in queries.values() for column in query["filters"]}
+        | {
+            metric.split(":")[1]
+            for query in queries.values()
+            for metric in query["metrics"]
+            if metric != "count"
+        }
+    )
+    for scale in scales:
+        frame = pd.concat([df[columns]] * scale, ignore_index=True)
+        print(f"analytics queries, {len(frame)} rows:")
+        for backend_name, backend in backends.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for query in queries.values():
+                    backend.aggregate(frame, query)
+            seconds = (time.perf_counter() - start) / repeat
+            print(f"  {backend_name:16} {seconds * 1000:10.1f} ms for all queries")
+        del frame
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--cache", action="store_true", help="serve repeated requests from the cache"
+    )
+    parser.add_argument("--serialization", action="store_true")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--analytics", action="store_true")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    if args.serialization:
+        _serialization(args.repeat)
+        return
+
+    if args.analytics:
+        _analytics(args.scales, args.repeat)
+        return
+
+    # the probe alone, one request at a time
+    idle = asyncio.run(_run([PROBE] * 200, 1))
+    _report("probe without load:", idle)
+
+    # the probe mixed into concurrent traffic
+    mixed = list(itertools.islice(itertools.cycle(MIXED_TRAFFIC), args.requests))
+    if not args.cache:
+        mixed = _bust_cache(mixed)
+    loaded = asyncio.run(_run(mixed, args.concurrency))
+    _report(f"mixed traffic, concurrency {args.concurrency}:", loaded)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Benchmark suite of every route of the API on synthetic datasets of growing size.
+
+For each scale (times the 119390 rows of the original dataset), a synthetic csv file is
+generated once with synthetic.py and the API is started on it in a fresh process, with its own
+database and Arrow cache, so the load of one scale does not leak into the next. Every GET route is
+then driven in-process through an ASGI client: a warm-up request, then the given number of requests
+over the given number of concurrent clients. The routes that change the dataset
+(/dataset/reload/, /bookings/append/) are left out, so every run sees the same data.
+
+Reported per scale: the rows, the startup time (cold load of the csv file, the database and the aggregates)
+and the peak resident memory of the process; per route: throughput, p50 and p99 latency, error count.
+The results are written as JSON, with the versions of Python and of the main packages, and can be
+compared with the ones of a previous run.
+
+The response cache and the aggregate cache are disabled unless --cache is given,
+so the numbers show the work of the routes, not the cache hits.
+
+Usage:
+    python benchmark_suite.py --scales 1 10 100 --output results.json
+    python benchmark_suite.py --scales 0.1 1 --requests 20 --compare results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from synthetic import BASE_ROWS, write_csv
+
+# every GET route of the API, with the parameters of a typical request
+ROUTES = [
+    ("/bookings", {"limit": 100}),
+    ("/bookings/1", {}),
+    ("/bookings/search/", {"guest_name": "Jamie Smith", "limit": 100}),
+    ("/bookings/stats/", {}),
+    (
+        "/bookings/analysis/",
+        {
+            "request_data": [
+                "booking_trends_by_month",
+                "guest_demographics",
+                "popular_meal_packages",
+            ]
+        },
+    ),
+    ("/bookings/nationality/", {"nationality": "PRT", "limit": 100}),
+    ("/bookings/popular_meal_package/", {}),
+    ("/bookings/avg_length_of_stay/", {}),
+    ("/bookings/total_revenue/", {}),
+    ("/bookings/top_countries/", {}),
+    ("/bookings/repeated_guests_percentage/", {}),
+    ("/bookings/total_guests_by_year/", {}),
+    ("/bookings/avg_daily_rate_resort/", {}),
+    ("/bookings/most_common_arrival_day_city/", {}),
+    ("/bookings/count_by_hotel_meal/", {}),
+    ("/bookings/total_revenue_resort_by_country/", {}),
+    ("/bookings/count_by_hotel_repeated_guest/", {}),
+    (
+        "/bookings/export/",
+        {
+            "format": "csv",
+            "source": "dataframe",
+            "guest_name": "Jamie Smith",
+            "nationality": "PRT",
+        },
+    ),
+    ("/cache/stats/", {}),
+    (
+        "/bookings/aggregate/",
+        {"group_by": ["hotel", "arrival_date_month"], "metric": ["count", "sum:adr"]},
+    ),
+    ("/metrics", {}),
+]
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def _drive(app, auth, path: str, params: dict, requests: int, concurrency: int):
+    import httpx
+
+    latencies = []
+    errors = 0
+    queue = iter(range(requests))
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark", auth=auth
+    ) as client:
+
+        async def get() -> float:
+            nonlocal errors
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            await response.aread()
+            if response.status_code >= 400:
+                errors += 1
+            return time.perf_counter() - start
+
+        async def worker():
+            for _ in queue:
+                latencies.append(await get())
+
+        await get()
+        # the warm-up request is not counted
+        errors = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def _worker(requests: int, concurrency: int) -> dict:
+    """
+    Runs in the process of one scale: starts the API on the dataset of the settings
+    and drives every route. Returns the results of the scale.
+    """
+    # main loads the dataset of the settings when imported
+    start = time.perf_counter()
+    import main as api
+    from authentication import user_db
+    from database import async_db_engine
+
+    startup_seconds = time.perf_counter() - start
+    startup_rss = _peak_rss()
+    auth = next(iter(user_db.items()))
+
+    async def run() -> dict:
+        routes = {}
+        for path, params in ROUTES:
+            routes[path] = await _drive(
+                api.app, auth, path, params, requests, concurrency
+            )
+        # the pooled connections belong to this event loop
+        await async_db_engine.dispose()
+        return routes
+
+    routes = asyncio.run(run())
+    return {
+        "rows": len(api.dataset.df),
+        "startup_seconds": startup_seconds,
+        "peak_rss_startup_bytes": startup_rss,
+        "peak_rss_bytes": _peak_rss(),
+        "routes": routes,
+    }
+
+
+def _dataset(directory: str, rows: int, seed: int) -> tuple:
+    # generates the csv file of the scale, unless the one there has the same rows and seed
+    path = os.path.join(directory, "hotel_booking_data.csv")
+    marker = os.path.join(directory, "synthetic.json")
+    expected = {"rows": rows, "seed": seed}
+    if os.path.exists(path) and os.path.exists(marker):
+        with open(marker) as file:
+            if json.load(file) == expected:
+                return path, 0.0
+
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    write_csv(path, rows, seed)
+    with open(marker, "w") as file:
+        json.dump(expected, file)
+    return path, time.perf_counter() - start
+
+
+def _run_scale(scale: float, args) -> dict:
+    rows = int(BASE_ROWS * scale)
+    directory = os.path.abspath(os.path.join(args.workdir, f"x{scale:g}"))
+    path, generate_seconds = _dataset(directory, rows, args.seed)
+    print(f"scale {scale:g}: {rows} rows", file=sys.stderr)
+
+    # a cold start at every run: the database, the Arrow cache and the cache of the API are rebuilt
+    database = os.path.join(directory, "hotel.db")
+    for name in os.listdir(directory):
+        if name.startswith(("hotel.db", "hotel_cache.db", "hotel_booking_data.arrow")):
+            os.remove(os.path.join(directory, name))
+    env = {
+        **os.environ,
+        "HOTEL_API_DATASET_PATH": path,
+        "HOTEL_API_DATASET_CACHE_PATH": os.path.join(
+            directory, "hotel_booking_data.arrow"
+        ),
+        "HOTEL_API_DATABASE_URL": f"sqlite:///{database}",
+        "HOTEL_API_ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{database}",
+        "HOTEL_API_CACHE_PATH": os.path.join(directory, "hotel_cache.db"),
+    }
+    if not args.cache:
+        # every entry is evicted as soon as it is stored
+        env["HOTEL_API_CACHE_MAX_BYTES"] = "0"
+
+    worker = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            "--requests",
+            str(args.requests),
+            "--concurrency",
+            str(args.concurrency),
+        ],
+        env=env,
+        cwd=directory,
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    # the results are the last line, the API may log before them
+    result = json.loads(worker.stdout.decode().strip().splitlines()[-1])
+    return {"scale": scale, "generate_seconds": generate_seconds, **result}
+
+
+def _versions() -> dict:
+    versions = {}
+    for package in ("numpy", "pandas", "pyarrow", "fastapi", "pydantic", "sqlalchemy"):
+        try:
+            versions[package] = __import__(package).__version__
+        except ImportError:
+            versions[package] = None
+    return versions
+
+
+def _report(results: dict) -> None:
+    for scale in results["scales"]:
+        print(
+            f"scale {scale['scale']:g}: {scale['rows']} rows, "
+            f"startup {scale['startup_seconds']:.1f} s, "
+            f"peak RSS {scale['peak_rss_bytes'] / 1024**2:.0f} MiB"
+        )
+        for path, route in scale["routes"].items():
+            print(
+                f"  {path:45} {route['throughput']:9.1f} req/s"
+                f"  p50={route['p50_ms']:9.2f} ms  p99={route['p99_ms']:9.2f} ms"
+                + (f"  errors={route['errors']}" if route["errors"] else "")
+            )
+
+
+def _compare(results: dict, previous: dict) -> None:
+    # change of the latencies against a previous run, for the scales and routes of both
+    before = {scale["scale"]: scale for scale in previous["scales"]}
+    for scale in results["scales"]:
+        old = before.get(scale["scale"])
+        if old is None:
+            continue
+        print(f"scale {scale['scale']:g} against the previous run:")
+        for path, route in scale["routes"].items():
+            if path not in old["routes"]:
+                continue
+            changes = [
+                f"{key}={(route[key] / old['routes'][path][key] - 1) * 100:+7.1f}%"
+                for key in ("p50_ms", "p99_ms")
+            ]
+            print(f"  {path:45} " + "  ".join(changes))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--requests", type=int, default=50, help="per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default="benchmark-data")
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--compare", help="JSON file of a previous run")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_worker(args.requests, args.concurrency)))
+        return
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": _versions(),
+        "options": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "cache": args.cache,
+        },
+        "scales": [_run_scale(scale, args) for scale in args.scales],
+    }
+
+    _report(results)
+    if args.compare:
+        with open(args.compare) as file:
+            _compare(results, json.load(file))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
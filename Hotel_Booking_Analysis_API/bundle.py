@@ -0,0 +1,101 @@
+from typing import NamedTuple
+
+import pandas as pd
+
+from database import StaleDatasetError, append_bookings, load_bookings, read_appends
+from dataset import SOURCE_COLUMNS, AppendStorage, build_country_index, load_dataframe
+from snapshot import AnalyticsSnapshot, get_snapshot
+
+
+class DatasetBundle(NamedTuple):
+    """
+    Everything built from one version of the csv file. A bundle is never modified:
+    a reload builds a new one and replaces the reference to it, so a request that took the old bundle
+    finishes against the old version, and the old DataFrame is released once no request holds it.
+    """
+
+    version: str
+    df: pd.DataFrame
+    country_index: dict
+    snapshot: AnalyticsSnapshot
+    # arrays the appends extend, shared with the bundles extended from this one
+    storage: AppendStorage
+
+
+# appends tried before giving up, when other workers keep appending in between
+APPEND_ATTEMPTS = 3
+
+
+def build_bundle(path: str, cache_path: str, cache=None, backend=None) -> DatasetBundle:
+    """
+    Loads the csv file in the "bookings" table and the DataFrame, unless they are current,
+    and builds the country index and the aggregates of the dataset, on the analytics backend.
+    """
+    version = load_bookings(path)
+    df = load_dataframe(path, version, cache_path)
+    return DatasetBundle(
+        version=version,
+        df=df,
+        country_index=build_country_index(df),
+        snapshot=get_snapshot(df, version, cache, backend),
+        storage=AppendStorage(),
+    )
+
+
+def extend_bundle(
+    bundle: DatasetBundle,
+    path: str,
+    raw: pd.DataFrame,
+    cache_path: str,
+    cache=None,
+    backend=None,
+) -> DatasetBundle:
+    """
+    Appends rows (columns of the csv file) to the dataset and returns the bundle of the new version.
+    The frame, the country index and the aggregates are extended with the new rows only.
+    Rows other workers appended since bundle was built are taken in first, the new rows go after them.
+    Raises StaleDatasetError if other workers kept appending during APPEND_ATTEMPTS attempts.
+    """
+    for _ in range(APPEND_ATTEMPTS):
+        # the frame first: rows it cannot take are rejected before the table and the file change
+        df = bundle.storage.extend_frame(bundle.df, raw)
+        try:
+            version = append_bookings(path, raw, bundle.version)
+        except StaleDatasetError:
+            bundle = refresh_bundle(bundle, path, cache_path, cache, backend)
+            continue
+        return _with_rows(bundle, df, version, backend)
+    raise StaleDatasetError("The dataset kept changing, retry the append")
+
+
+def refresh_bundle(
+    bundle: DatasetBundle, path: str, cache_path: str, cache=None, backend=None
+) -> DatasetBundle:
+    """
+    Returns the bundle of the current csv file: bundle itself if its version is current,
+    bundle extended with the rows other workers appended since, or a new bundle if the file changed otherwise.
+    """
+    version = load_bookings(path)
+    if version == bundle.version:
+        return bundle
+    raw = read_appends(path, bundle.version, version)
+    if raw is None:
+        return build_bundle(path, cache_path, cache, backend)
+    df = bundle.storage.extend_frame(bundle.df, raw[SOURCE_COLUMNS])
+    return _with_rows(bundle, df, version, backend)
+
+
+def _with_rows(
+    bundle: DatasetBundle, df: pd.DataFrame, version: str, backend=None
+) -> DatasetBundle:
+    # the country index and the aggregates are updated with the rows df has after the ones of bundle
+    rows = df.iloc[len(bundle.df) :]
+    return DatasetBundle(
+        version=version,
+        df=df,
+        country_index=bundle.storage.extend_country_index(
+            bundle.country_index, rows, len(bundle.df)
+        ),
+        snapshot=bundle.snapshot.extend(df, rows, version, backend),
+        storage=bundle.storage,
+    )
@@ -0,0 +1,307 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from executor import run_in_pool
+
+# access times of the LRU kept in memory before they are written to the SQLite file
+ACCESS_BATCH = 256
+
+
+class CacheBackend(ABC):
+    """
+    Key-value store of bytes with size limits, an optional time to live and hit/miss/eviction metrics.
+
+    eviction: "lru" drops the least recently used entries first, "fifo" the oldest ones.
+    Async code uses get_object_async and set_object_async: the backends doing I/O run in the worker pool,
+    so they never block the event loop.
+    """
+
+    # whether get and set wait on I/O
+    blocking = False
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 256 * 1024**2,
+        ttl: Optional[float] = None,
+        eviction: str = "lru",
+    ):
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.eviction = eviction
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the value of key, or None if it is missing or expired.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """
+        Stores value under key, for ttl seconds or the ttl of the cache, and evicts entries over the limits.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Removes key, if present.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Removes every entry.
+        """
+
+    def _expires(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else time.time() + ttl
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def get_object(self, key: str):
+        value = self.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def set_object(self, key: str, value, ttl: Optional[float] = None) -> None:
+        self.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+
+    async def get_object_async(self, key: str):
+        if self.blocking:
+            return await run_in_pool(self.get_object, key)
+        return self.get_object(key)
+
+    async def set_object_async(self, key: str, value, ttl: Optional[float] = None):
+        if self.blocking:
+            await run_in_pool(self.set_object, key, value, ttl)
+        else:
+            self.set_object(key, value, ttl)
+
+
+class MemoryCache(CacheBackend):
+    """
+    Cache in the memory of the process.
+    """
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.eviction == "lru":
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, self._expires(ttl))
+            self._size += len(value)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        value, expires = self._entries.pop(key)
+        self._size -= len(value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **super().stats(),
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache in an SQLite file shared by all the workers of a host:
+    a value computed by one worker is reused by the others.
+    The metrics count the hits, misses and evictions of this process.
+
+    Reads never write: the access times of the LRU are kept in memory and written in batches,
+    with the next set or every ACCESS_BATCH hits, and expired entries are removed by the eviction.
+
+    The values are pickled, and unpickling runs code: the file is created readable and writable
+    by its owner only, and a file others can write to is refused.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, **limits):
+        super().__init__(**limits)
+        _check_private(path)
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_created ON cache (created)"
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            if self.eviction == "lru":
+                self._accessed[key] = now
+                if len(self._accessed) >= ACCESS_BATCH:
+                    self._connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._write_accessed()
+                        self._connection.execute("COMMIT")
+                    except BaseException:
+                        self._connection.execute("ROLLBACK")
+                        raise
+            self.hits += 1
+            return row[0]
+
+    def _write_accessed(self) -> None:
+        self._connection.executemany(
+            "UPDATE cache SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._accessed.items()],
+        )
+        self._accessed.clear()
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, len(value), self._expires(ttl), now, now),
+                )
+                self._write_accessed()
+                self._evict(now)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float) -> None:
+        self._connection.execute("DELETE FROM cache WHERE expires < ?", (now,))
+        entries, size = self._connection.execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM cache"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+
+        order = "accessed" if self.eviction == "lru" else "created"
+        evicted = []
+        for key, entry_size in self._connection.execute(
+            f"SELECT key, size FROM cache ORDER BY {order}"
+        ):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+        self._connection.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM cache"
+            ).fetchone()
+        return {**super().stats(), "entries": entries, "bytes": size}
+
+
+def _check_private(path: str) -> None:
+    # creates the file for its owner only; SQLite gives its journal files the same permissions
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    status = os.stat(path)
+    if status.st_mode & 0o022 or (
+        hasattr(os, "getuid") and status.st_uid != os.getuid()
+    ):
+        raise ValueError(
+            f"The cache file {path} must be owned by this user and writable by no one else"
+        )
+
+
+def create_cache(
+    backend: str, path: str, max_entries: int, max_bytes: int, ttl, eviction: str
+) -> CacheBackend:
+    """
+    Returns the cache backend chosen in the settings: "memory" or "sqlite" (shared between workers).
+    """
+    limits = {
+        "max_entries": max_entries,
+        "max_bytes": max_bytes,
+        "ttl": ttl,
+        "eviction": eviction,
+    }
+    if backend == "memory":
+        return MemoryCache(**limits)
+    if backend == "sqlite":
+        return SQLiteCache(path, **limits)
+    raise ValueError(f"Unknown cache backend: {backend}")
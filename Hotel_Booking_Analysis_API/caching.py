@@ -0,0 +1,94 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from cache import CacheBackend
+
+
+class ResponseCacheMiddleware:
+    """
+    HTTP caching for GET routes whose responses only change with the dataset.
+
+    Every response gets a strong ETag derived from the dataset version, the route, the normalized query
+    and the credentials. A request whose If-None-Match holds the current ETag is answered with
+    304 Not Modified without running the handler, other requests are answered from an in-process LRU
+    of serialized responses. A new dataset version changes every ETag, so nothing stale is served.
+
+    The serialized responses are kept in a cache backend, shared by the workers when it is the SQLite one.
+    """
+
+    def __init__(self, app, paths, version, cache: CacheBackend, max_age: int = 60):
+        self.app = app
+        self.paths = set(paths)
+        self.version = version
+        self.cache = cache
+        self.max_age = max_age
+
+    def _key(self, scope, headers: Headers) -> str:
+        # the credentials are part of the key: a cached response of a protected route
+        # is only served to the same credentials.
+        # the parameters are sorted by name only: the values of a repeated parameter
+        # keep their order, which the response may depend on
+        parameters = parse_qsl(scope["query_string"].decode(), keep_blank_values=True)
+        query = urlencode(sorted(parameters, key=lambda parameter: parameter[0]))
+        authorization = headers.get("authorization", "")
+        return "\n".join([scope["path"], query, authorization])
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        version = self.version()
+        key = self._key(scope, headers)
+        digest = hashlib.sha256(f"{version}\n{key}".encode()).hexdigest()[:32]
+        etag = f'"{digest}"'
+        visibility = "private" if "authorization" in headers else "public"
+        cache_headers = [
+            (b"etag", etag.encode()),
+            (b"cache-control", f"{visibility}, max-age={self.max_age}".encode()),
+        ]
+
+        # the client already has this version of the response
+        if etag in headers.get("if-none-match", ""):
+            await send(
+                {"type": "http.response.start", "status": 304, "headers": cache_headers}
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # the digest covers the version, responses of older versions are never hit
+        cache_key = f"response:{digest}"
+        entry = await self.cache.get_object_async(cache_key)
+        if entry is not None:
+            await send(
+                {"type": "http.response.start", "status": 200, "headers": entry[0]}
+            )
+            await send({"type": "http.response.body", "body": entry[1]})
+            return
+
+        start = {}
+        body = []
+
+        async def send_and_store(message):
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    response_headers = MutableHeaders(scope=message)
+                    for name, value in cache_headers:
+                        response_headers[name.decode()] = value.decode()
+                start.update(message)
+            elif message["type"] == "http.response.body" and start["status"] == 200:
+                body.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self.cache.set_object_async(
+                        cache_key, (start["headers"], b"".join(body))
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_and_store)
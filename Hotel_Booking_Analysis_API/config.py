@@ -0,0 +1,85 @@
+from typing import Optional
+
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+# settings of the application, can be overridden by environment variables
+# with the HOTEL_API_ prefix, e.g. HOTEL_API_WORKER_POOL_SIZE=8
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="HOTEL_API_")
+
+    dataset_path: str = "hotel_booking_data.csv"
+    # columnar cache of the csv file, rebuilt when the csv file changes
+    dataset_cache_path: str = "hotel_booking_data.arrow"
+    database_url: str = "sqlite:///hotel.db"
+    async_database_url: str = "sqlite+aiosqlite:///hotel.db"
+    # pool of read-only connections of the requests
+    db_pool_size: int = 8
+    db_max_overflow: int = 8
+    # SQLite tuning: memory-mapped I/O and page cache of the read connections in bytes,
+    # prepared statements cached by every connection, wait for a lock in milliseconds
+    sqlite_mmap_size: int = 256 * 1024**2
+    sqlite_cache_size: int = 64 * 1024**2
+    sqlite_cached_statements: int = 256
+    sqlite_busy_timeout: int = 5000
+    # seconds between checks of the csv file for changes, None (an empty variable) or 0
+    # to reload it only on request
+    dataset_watch_interval: Optional[float] = None
+    # seconds between checks for rows appended by the other workers, None (an empty variable) or 0 to disable
+    dataset_sync_interval: Optional[float] = 1.0
+
+    # number of threads for the CPU-bound DataFrame work
+    worker_pool_size: int = 4
+
+    # cache of the computed aggregates and responses: "memory" for each worker on its own,
+    # "sqlite" for a file shared by the workers of the host
+    cache_backend: str = "memory"
+    cache_path: str = "hotel_cache.db"
+    cache_max_entries: int = 1024
+    cache_max_bytes: int = 256 * 1024**2
+    # time to live of the entries in seconds, None (an empty variable) to keep them until evicted
+    cache_ttl: Optional[float] = None
+    # "lru" or "fifo"
+    cache_eviction: str = "lru"
+
+    # how long clients may reuse a response before revalidating it, in seconds
+    response_cache_max_age: int = 60
+
+    # encode the large list responses straight to bytes, without validating every item
+    fast_responses: bool = False
+
+    # level of the messages of the API (dataset loads and memory, reloads), next to the ones of uvicorn
+    log_level: str = "INFO"
+
+    # engine of /bookings/aggregate/ and of the analytics endpoints: "pandas" or "duckdb" (needs duckdb installed),
+    # with the number of DuckDB threads, None (an empty variable) for all cores
+    analytics_backend: str = "pandas"
+    analytics_threads: Optional[int] = None
+
+    # request counts, latencies and time in sql, compute and serialization, served at /metrics
+    metrics_enabled: bool = True
+
+    # on-demand profiling, off unless a token or a sample rate is set: requests with the header
+    # X-Profile-Token: <token>, and this fraction of the others, get a CPU and a memory profile
+    # written to the directory. The profiler is not installed at all when off
+    profiling_token: Optional[str] = None
+    profiling_sample_rate: float = 0.0
+    profiling_dir: str = "profiles"
+    # seconds between two samples of the CPU profile
+    profiling_interval: float = 0.005
+
+    @field_validator(
+        "dataset_watch_interval",
+        "dataset_sync_interval",
+        "cache_ttl",
+        "analytics_threads",
+        mode="before",
+    )
+    @classmethod
+    def empty_is_none(cls, value):
+        # an empty variable, e.g. HOTEL_API_CACHE_TTL=, is None rather than a malformed number
+        return None if value == "" else value
+
+
+settings = Settings()
@@ -0,0 +1,483 @@
+from config import settings
+from dataset import file_sha256, file_stat
+from datetime import date, datetime
+
+import hashlib
+import io
+import os
+
+from sqlalchemy import and_, create_engine, event, func, insert, select
+from sqlalchemy import Column, Integer, String, Float, Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator
+
+import pandas as pd
+
+
+def _read_only_url(url: str):
+    # the same database file, opened with mode=ro: the request connections can never write
+    url = make_url(url)
+    return url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"},
+    )
+
+
+# create bd SQLite: the engine of the loads and appends, the only one writing
+db_engine = create_engine(
+    settings.database_url,
+    connect_args={"cached_statements": settings.sqlite_cached_statements},
+)
+
+
+@event.listens_for(db_engine, "connect")
+def _tune_writer(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: readers keep reading the last committed version while a load or an append writes,
+    # the mode is stored in the database file
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout = {settings.sqlite_busy_timeout}")
+    cursor.close()
+
+
+# async engine for the requests, so database access does not block the event loop:
+# a sized pool of read-only connections
+async_db_engine = create_async_engine(
+    _read_only_url(settings.async_database_url),
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    connect_args={"cached_statements": settings.sqlite_cached_statements},
+)
+
+
+@event.listens_for(async_db_engine.sync_engine, "connect")
+def _tune_reader(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA mmap_size = {settings.sqlite_mmap_size}")
+    # a negative cache size is in KiB
+    cursor.execute(f"PRAGMA cache_size = {-(settings.sqlite_cache_size // 1024)}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout = {settings.sqlite_busy_timeout}")
+    cursor.close()
+
+
+# defining the schema of the "bookings" table
+Base = declarative_base()
+
+
+# create custom data type for dates stored as ISO text ("YYYY-MM-DD"):
+# the stored text is returned as is, and it sorts like the dates,
+# so equality and range filters on the column use its index
+class ISODate(TypeDecorator):
+    impl = String(10)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+
+# create table
+class Booking(Base):
+    __tablename__ = "bookings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    booking_date = Column(ISODate, index=True)
+    length_of_stay = Column(Integer, index=True)
+    guest_name = Column(String)
+    daily_rate = Column(Float, index=True)
+
+    # indexes for /bookings/search/: the composite index serves the combined filter
+    # and, as its leading column, the guest name alone
+    __table_args__ = (
+        Index("ix_bookings_search", "guest_name", "booking_date", "length_of_stay"),
+    )
+
+
+# fingerprint of the csv file the "bookings" table was loaded from
+class DatasetMeta(Base):
+    __tablename__ = "dataset_meta"
+
+    id = Column(Integer, primary_key=True)
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    sha256 = Column(String)
+
+
+class DatasetAppend(Base):
+    # one row per append since the csv file was loaded: the version it made from the previous one,
+    # and the byte range of the appended rows in the file, for the other workers to read them
+    __tablename__ = "dataset_appends"
+
+    version = Column(String, primary_key=True)
+    previous = Column(String)
+    start = Column(Integer)
+    end = Column(Integer)
+
+
+# create a session to work with the database
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+AsyncSessionLocal = async_sessionmaker(async_db_engine, expire_on_commit=False)
+
+# columns of the csv file needed for the "bookings" table
+BOOKING_SOURCE_COLUMNS = [
+    "arrival_date_year",
+    "arrival_date_month",
+    "arrival_date_day_of_month",
+    "stays_in_weekend_nights",
+    "stays_in_week_nights",
+    "name",
+    "adr",
+]
+
+# number of csv rows read and inserted at once
+LOAD_CHUNK_SIZE = 20_000
+
+# version of the layout of the tables, kept in the SQLite user_version:
+# tables written by another version are reloaded
+BOOKINGS_SCHEMA_VERSION = 3
+
+
+# dependency function to get database session
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# create, filter DataFrame for the db
+def _booking_rows(chunk: pd.DataFrame, first_id: int) -> pd.DataFrame:
+    df1 = pd.DataFrame(
+        {"id": range(first_id, first_id + len(chunk))}, index=chunk.index
+    )
+    df1["booking_date"] = pd.to_datetime(
+        chunk["arrival_date_year"].astype(str)
+        + "-"
+        + chunk["arrival_date_month"]
+        + "-"
+        + chunk["arrival_date_day_of_month"].astype(str),
+        format="%Y-%B-%d",
+    ).dt.strftime("%Y-%m-%d")
+    df1["length_of_stay"] = chunk.stays_in_weekend_nights + chunk.stays_in_week_nights
+    df1["guest_name"] = chunk["name"]
+    df1["daily_rate"] = chunk.adr
+    return df1
+
+
+def _same_stat(stored, stat: dict) -> bool:
+    return stored.size == stat["size"] and stored.mtime_ns == stat["mtime_ns"]
+
+
+def _stored_fingerprint(connection):
+    if connection.exec_driver_sql("PRAGMA user_version").scalar() != (
+        BOOKINGS_SCHEMA_VERSION
+    ):
+        return None
+    return connection.execute(select(DatasetMeta).where(DatasetMeta.id == 1)).first()
+
+
+def load_bookings(path: str) -> str:
+    """
+    Makes sure the "bookings" table holds the content of the csv file and returns the version of the dataset:
+    the sha256 of the file, chained with the appended rows (see append_bookings) if the file was loaded before them.
+
+    The table is reloaded only when the fingerprint of the file differs from the one stored with the table,
+    so a restart against an unchanged file costs a stat call and one query.
+    The reload runs in a single IMMEDIATE transaction: it holds the SQLite write lock,
+    so other workers starting at the same time wait for it and then find the table current.
+    The tables are created in that transaction too, not when the module is imported,
+    so workers starting on a new database do not race to create them.
+    """
+    stat = file_stat(path)
+
+    with db_engine.connect() as connection:
+        stored = _stored_fingerprint(connection)
+    if stored is not None and _same_stat(stored, stat):
+        _create_indexes(db_engine)
+        return stored.sha256
+
+    sha256 = file_sha256(path)
+
+    with db_engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.exec_driver_sql("PRAGMA busy_timeout = 600000")
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            # another worker may have loaded the same file while we waited for the lock
+            Base.metadata.create_all(
+                connection, tables=[DatasetMeta.__table__, DatasetAppend.__table__]
+            )
+            stored = _stored_fingerprint(connection)
+            if stored is None or stored.sha256 != sha256:
+                # the indexes are created after the bulk insert, not updated row by row
+                Booking.__table__.drop(connection, checkfirst=True)
+                connection.execute(CreateTable(Booking.__table__))
+
+                first_id = 1
+                for chunk in pd.read_csv(
+                    path, usecols=BOOKING_SOURCE_COLUMNS, chunksize=LOAD_CHUNK_SIZE
+                ):
+                    rows = _booking_rows(chunk, first_id)
+                    connection.execute(insert(Booking), rows.to_dict("records"))
+                    first_id += len(rows)
+
+            _create_indexes(connection)
+
+            # the appends are part of the file now
+            connection.execute(DatasetAppend.__table__.delete())
+            connection.execute(DatasetMeta.__table__.delete())
+            connection.execute(
+                insert(DatasetMeta), [{"id": 1, "sha256": sha256, **stat}]
+            )
+            connection.exec_driver_sql(
+                f"PRAGMA user_version = {BOOKINGS_SCHEMA_VERSION}"
+            )
+            connection.exec_driver_sql("COMMIT")
+        except BaseException:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+
+    return sha256
+
+
+class FilterError(ValueError):
+    """
+    Raised for a search parameter that cannot be parsed, e.g. a malformed date.
+    """
+
+
+def parse_date(value: str, parameter: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise FilterError(f"Invalid {parameter}: {value!r}, expected y-m-d")
+
+
+def _one_of(column, values):
+    # a value or a list of values: equality for one, IN for several
+    if not isinstance(values, (list, tuple)):
+        return column == values
+    if len(values) == 1:
+        return column == values[0]
+    return column.in_(values)
+
+
+def _between(column, low, high) -> list:
+    conditions = []
+    if low is not None:
+        conditions.append(column >= low)
+    if high is not None:
+        conditions.append(column <= high)
+    return conditions
+
+
+def _append_csv(path: str, raw: pd.DataFrame) -> bytes:
+    # the rows in the column order of the csv file, the columns the API does not keep left empty
+    header = pd.read_csv(path, nrows=0).columns
+    data = raw.reindex(columns=header).to_csv(header=False, index=False).encode()
+    with open(path, "ab") as file:
+        file.write(data)
+    return data
+
+
+class StaleDatasetError(RuntimeError):
+    """
+    Raised by append_bookings when the stored dataset is not the version the rows are appended to:
+    another worker appended or reloaded in between.
+    """
+
+
+def append_bookings(path: str, raw: pd.DataFrame, version: str) -> str:
+    """
+    Appends rows (columns of the csv file) to the "bookings" table and to the csv file,
+    after the given version of the dataset, and returns the new version.
+    Raises StaleDatasetError, and changes nothing, if the stored version is another one.
+
+    The rows are inserted in batches within one IMMEDIATE transaction, together with the new fingerprint;
+    the csv file stays the source of truth, so a restart finds the table current
+    and rebuilds the other caches from the file. The new version chains the previous one
+    with the sha256 of the appended data, so its cost depends on the rows, not on the file.
+    """
+    with db_engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.exec_driver_sql("PRAGMA busy_timeout = 600000")
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        size = None
+        try:
+            stored = _stored_fingerprint(connection)
+            if stored is None:
+                raise RuntimeError("The bookings table is not loaded")
+            if stored.sha256 != version:
+                raise StaleDatasetError(
+                    f"The dataset is at version {stored.sha256}, not {version}"
+                )
+
+            first_id = (
+                connection.execute(select(func.max(Booking.id))).scalar() or 0
+            ) + 1
+            for start in range(0, len(raw), LOAD_CHUNK_SIZE):
+                chunk = raw.iloc[start : start + LOAD_CHUNK_SIZE]
+                rows = _booking_rows(chunk, first_id)
+                connection.execute(insert(Booking), rows.to_dict("records"))
+                first_id += len(rows)
+
+            size = os.path.getsize(path)
+            data = _append_csv(path, raw)
+            version = hashlib.sha256(
+                stored.sha256.encode() + hashlib.sha256(data).digest()
+            ).hexdigest()
+
+            connection.execute(
+                insert(DatasetAppend),
+                [
+                    {
+                        "version": version,
+                        "previous": stored.sha256,
+                        "start": size,
+                        "end": size + len(data),
+                    }
+                ],
+            )
+            connection.execute(DatasetMeta.__table__.delete())
+            connection.execute(
+                insert(DatasetMeta),
+                [{"id": 1, "sha256": version, **file_stat(path)}],
+            )
+            connection.exec_driver_sql("COMMIT")
+        except BaseException:
+            connection.exec_driver_sql("ROLLBACK")
+            if size is not None:
+                # the rows are not in the table: take them out of the file too
+                os.truncate(path, size)
+            raise
+
+    return version
+
+
+def stored_version():
+    """
+    Returns the version of the dataset in the "bookings" table, None if it is not loaded.
+    One query: cheap enough to poll for the appends of the other workers.
+    """
+    with db_engine.connect() as connection:
+        stored = _stored_fingerprint(connection)
+    return None if stored is None else stored.sha256
+
+
+def read_appends(path: str, version: str, current: str):
+    """
+    Returns the rows appended to the csv file from version to current (columns of the csv file),
+    as the other workers appended them. Returns None if current does not follow from version
+    by appends, e.g. the file was replaced: then the dataset has to be loaded again.
+    """
+    with db_engine.connect() as connection:
+        appends = {
+            append.previous: append
+            for append in connection.execute(select(DatasetAppend))
+        }
+
+    chain = []
+    while version != current:
+        append = appends.get(version)
+        if append is None:
+            return None
+        chain.append(append)
+        version = append.version
+
+    columns = pd.read_csv(path, nrows=0).columns
+    frames = []
+    with open(path, "rb") as file:
+        for append in chain:
+            file.seek(append.start)
+            data = file.read(append.end - append.start)
+            # the bytes must be the ones the version was computed from
+            if (
+                hashlib.sha256(
+                    append.previous.encode() + hashlib.sha256(data).digest()
+                ).hexdigest()
+                != append.version
+            ):
+                return None
+            frames.append(pd.read_csv(io.BytesIO(data), header=None, names=columns))
+    return pd.concat(frames, ignore_index=True)
+
+
+def search_filters(
+    guest_name=None,
+    booking_date=None,
+    length_of_stay=None,
+    date_from=None,
+    date_to=None,
+    min_stay=None,
+    max_stay=None,
+    min_rate=None,
+    max_rate=None,
+) -> list:
+    """
+    Returns the conditions for the search parameters that are set,
+    each with the error reported when no booking passes it, in checking order.
+
+    guest_name, booking_date and length_of_stay take a value or a list of values,
+    the other parameters are the inclusive bounds of ranges. Every condition is served by an index of the table.
+    Raises FilterError for a malformed date.
+    """
+    filters = []
+
+    if guest_name is not None:
+        filters.append((_one_of(Booking.guest_name, guest_name), "Guest not found"))
+
+    if booking_date:
+        if isinstance(booking_date, (list, tuple)):
+            dates = [parse_date(value, "booking_date") for value in booking_date]
+        else:
+            dates = parse_date(booking_date, "booking_date")
+        filters.append((_one_of(Booking.booking_date, dates), "Date not found"))
+
+    if date_from or date_to:
+        conditions = _between(
+            Booking.booking_date,
+            parse_date(date_from, "date_from") if date_from else None,
+            parse_date(date_to, "date_to") if date_to else None,
+        )
+        filters.append((and_(*conditions), "Date not found"))
+
+    if length_of_stay is not None:
+        filters.append(
+            (
+                _one_of(Booking.length_of_stay, length_of_stay),
+                "Length of stay not found",
+            )
+        )
+
+    if min_stay is not None or max_stay is not None:
+        conditions = _between(Booking.length_of_stay, min_stay, max_stay)
+        filters.append((and_(*conditions), "Length of stay not found"))
+
+    if min_rate is not None or max_rate is not None:
+        conditions = _between(Booking.daily_rate, min_rate, max_rate)
+        filters.append((and_(*conditions), "Daily rate not found"))
+
+    return filters
+
+
+def search_query(filters: list):
+    """
+    Returns the statement of /bookings/search/ for the filters of search_filters,
+    ordered by id: a page is taken from it with offset and limit.
+    """
+    conditions = [condition for condition, detail in filters]
+    return select(*Booking.__table__.columns).where(*conditions).order_by(Booking.id)
+
+
+def _create_indexes(bind) -> None:
+    # the indexes belong to the model: they survive reloads
+    # and are added to databases created before them
+    for index in Booking.__table__.indexes:
+        index.create(bind, checkfirst=True)
@@ -0,0 +1,356 @@
+import hashlib
+import inspect
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # the columnar cache is optional
+    pa = None
+
+
+# fingerprint of the csv file: size and modification time to detect a change cheaply,
+# sha256 of the content to tell a real change from a touched file
+def file_stat(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# columns kept in memory and how they are stored:
+# "category" - low-cardinality values as a categorical,
+# "integer" - the smallest integer type that holds the values,
+# "float" - float32 when it holds the values exactly, float64 otherwise,
+# "string" - python strings.
+# every column of the csv file is kept: /bookings/nationality/ returns them all
+COLUMN_SCHEMA = {
+    "hotel": "category",
+    "is_canceled": "integer",
+    "lead_time": "integer",
+    "arrival_date_year": "integer",
+    "arrival_date_month": "category",
+    "arrival_date_week_number": "integer",
+    "arrival_date_day_of_month": "integer",
+    "stays_in_weekend_nights": "integer",
+    "stays_in_week_nights": "integer",
+    "adults": "integer",
+    "children": "float",
+    "babies": "integer",
+    "meal": "category",
+    "country": "category",
+    "market_segment": "category",
+    "distribution_channel": "category",
+    "is_repeated_guest": "category",
+    "previous_cancellations": "integer",
+    "previous_bookings_not_canceled": "integer",
+    "reserved_room_type": "category",
+    "assigned_room_type": "category",
+    "booking_changes": "integer",
+    "deposit_type": "category",
+    "agent": "float",
+    "company": "float",
+    "days_in_waiting_list": "integer",
+    "customer_type": "category",
+    "adr": "float",
+    "required_car_parking_spaces": "integer",
+    "total_of_special_requests": "integer",
+    "reservation_status": "category",
+    "reservation_status_date": "category",
+    "name": "string",
+    "email": "string",
+    "phone-number": "string",
+    "credit_card": "string",
+}
+
+# columns derived from the dataset once at load time, by kind
+DERIVED_SCHEMA = {
+    "arrival_date": "date",
+    "day_of_week": "category",
+    "length_of_stay": "integer",
+    "revenue": "float",
+}
+
+# columns of the csv file, as returned by the API
+SOURCE_COLUMNS = list(COLUMN_SCHEMA)
+
+DAY_NAMES = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+# key of the schema metadata holding the sha256 of the csv file the cache was built from
+# and the version of the schema
+CACHE_VERSION_KEY = b"dataset_version"
+
+
+# layout of the cache file, raised whenever the way the columns are written changes
+CACHE_LAYOUT = 2
+
+# version of the cache format: changes whenever the schema or the layout changes, so the cache is rebuilt
+SCHEMA_VERSION = hashlib.sha256(
+    repr((COLUMN_SCHEMA, DERIVED_SCHEMA, CACHE_LAYOUT)).encode()
+).hexdigest()[:12]
+
+# rows of the smallest buffer of AppendStorage
+APPEND_MIN_CAPACITY = 1024
+
+log = logging.getLogger(__name__)
+
+
+def memory_usage_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+
+def _compact_column(column: pd.Series, kind: str) -> pd.Series:
+    if kind == "category":
+        return column.astype("category")
+    if kind == "integer":
+        return pd.to_numeric(column, downcast="integer")
+    if kind == "float":
+        # a column without any value, e.g. of appended rows, has no float type yet
+        column = column.astype("float64")
+        float32 = column.astype("float32")
+        if np.array_equal(float32.astype("float64"), column, equal_nan=True):
+            return float32
+        return column.astype("float64")
+    return column
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keeps the columns of COLUMN_SCHEMA, stored in the most compact type of their kind.
+    """
+    return pd.DataFrame(
+        {name: _compact_column(df[name], kind) for name, kind in COLUMN_SCHEMA.items()}
+    )
+
+
+def derive_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the columns of DERIVED_SCHEMA to a compacted frame, so the endpoints reuse them:
+    arrival_date (datetime64), day_of_week (category of DAY_NAMES),
+    length_of_stay (nights, integer) and revenue (daily rate times nights).
+    """
+    # month names are parsed once per category, not once per row
+    months = df.arrival_date_month.cat.rename_categories(
+        pd.to_datetime(df.arrival_date_month.cat.categories, format="%B").month
+    )
+    df["arrival_date"] = pd.to_datetime(
+        pd.DataFrame(
+            {
+                "year": df.arrival_date_year,
+                "month": months.astype("int64"),
+                "day": df.arrival_date_day_of_month,
+            }
+        )
+    )
+    df["day_of_week"] = pd.Categorical.from_codes(
+        df.arrival_date.dt.dayofweek, DAY_NAMES
+    )
+    df["length_of_stay"] = pd.to_numeric(
+        df.stays_in_weekend_nights.astype("int32") + df.stays_in_week_nights,
+        downcast="integer",
+    )
+    df["revenue"] = df.adr.astype("float64") * df.length_of_stay
+    return df
+
+
+def read_csv(path: str) -> pd.DataFrame:
+    raw = pd.read_csv(path)
+    df = derive_columns(compact_frame(raw))
+    log.info(
+        "dataset memory: %.1f MB as read from csv, %.1f MB compacted",
+        memory_usage_mb(raw),
+        memory_usage_mb(df),
+    )
+    return df
+
+
+def _cache_version(version: str) -> bytes:
+    return f"{version}:{SCHEMA_VERSION}".encode()
+
+
+def _read_cache(cache_path: str, version: str):
+    if not os.path.exists(cache_path):
+        return None
+
+    # memory-map the file: the integer, float, date and category code columns without nulls
+    # become views of its pages, shared by the workers of one host (split_blocks keeps pandas
+    # from consolidating them into copies). The guest names are converted to python strings,
+    # and the country codes with nulls are copied: these stay private to each worker
+    reader = pa.ipc.open_file(pa.memory_map(cache_path))
+    if (reader.schema.metadata or {}).get(CACHE_VERSION_KEY) != _cache_version(version):
+        return None
+    return reader.read_all().to_pandas(split_blocks=True)
+
+
+def _write_cache(df: pd.DataFrame, cache_path: str, version: str) -> None:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # NaN stays a float value, not a null: a float column with nulls is copied when read back
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(i).null_count:
+            column = pa.array(df[field.name].to_numpy(), type=field.type)
+            table = table.set_column(i, field, column)
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, CACHE_VERSION_KEY: _cache_version(version)}
+    )
+
+    # write next to the cache and rename, so other workers never map a half-written file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(
+        sink, table.schema
+    ) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+
+def load_dataframe(path: str, version: str, cache_path: str) -> pd.DataFrame:
+    """
+    Loads the dataset, compacted to COLUMN_SCHEMA and with the DERIVED_SCHEMA columns,
+    from the Arrow IPC (Feather v2) cache of the csv file.
+    The csv file stays the source of truth: the cache is rebuilt when its version
+    differs from the sha256 of the csv file, or when it does not exist yet.
+    Without pyarrow the csv file is parsed on every call.
+    """
+    if pa is None:
+        return read_csv(path)
+
+    df = _read_cache(cache_path, version)
+    if df is None:
+        df = read_csv(path)
+        _write_cache(df, cache_path, version)
+    log.info("dataset: %d rows, %.1f MB in memory", len(df), memory_usage_mb(df))
+    return df
+
+
+def build_country_index(df: pd.DataFrame) -> dict:
+    """
+    Returns the row positions of the bookings of every country, computed in one pass.
+    """
+    return df.groupby("country", observed=True).indices
+
+
+def _append(buffer: np.ndarray, length: int, values: np.ndarray) -> np.ndarray:
+    # writes values after the first length items of buffer, in place while it has room and the dtype,
+    # else into a new buffer of twice the size: n appended values cost O(n), amortized
+    end = length + len(values)
+    if end > len(buffer) or buffer.dtype != values.dtype or not buffer.flags.writeable:
+        grown = np.empty(max(end, 2 * length, APPEND_MIN_CAPACITY), dtype=values.dtype)
+        grown[:length] = buffer[:length]
+        buffer = grown
+    buffer[length:end] = values
+    return buffer
+
+
+def _from_codes(codes: np.ndarray, dtype: pd.CategoricalDtype) -> pd.Categorical:
+    # the codes are valid by construction: pandas >= 2.1 can skip checking them
+    if _FROM_CODES_VALIDATES:
+        return pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
+_FROM_CODES_VALIDATES = (
+    "validate" in inspect.signature(pd.Categorical.from_codes).parameters
+)
+
+
+class AppendStorage:
+    """
+    Arrays with room for appended rows, behind the frame and the country index of successive appends.
+
+    A frame extended here is a view of the first rows of the arrays: the new rows are written after them,
+    so the rows already there are neither copied, parsed nor recomputed, and an append costs
+    O(appended rows), amortized; the arrays double in size when full. The frames of the older versions
+    are views of their own rows only, so requests still using them are not affected.
+    Only the frame and the index of the last append are extended in place: extending another one
+    (e.g. after an append that failed) copies it first. The existing rows are also copied
+    the first time (the columns of the Arrow cache are read-only), when a column needs a wider dtype,
+    and the category codes when a new category is merged in.
+    """
+
+    def __init__(self):
+        # rows of the frame and of the index the arrays were last extended to
+        self.rows = None
+        self.columns = {}
+        self.index_rows = None
+        self.index = {}
+
+    def extend_frame(self, df: pd.DataFrame, raw: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns a new frame with the rows of raw (columns of the csv file) appended to df.
+        The new rows are compacted and derived on their own. New categories are merged
+        into the sorted categories of df, as a fresh load sorts them: the extended frame,
+        and every result grouped by its categories, are the same as after a restart.
+        """
+        rows = derive_columns(compact_frame(raw))
+        length, end = len(df), len(df) + len(rows)
+        if self.rows != length:
+            self.columns = {}
+
+        columns = {}
+        for name in df.columns:
+            old, new = df[name], rows[name]
+            if isinstance(old.dtype, pd.CategoricalDtype):
+                values = new.astype(object)
+                categories = old.cat.categories
+                codes = self.columns.get(name)
+                if codes is None:
+                    codes = old.cat.codes.to_numpy()
+                extra = pd.Index(values.dropna().unique()).difference(categories)
+                if len(extra):
+                    merged = categories.append(extra).sort_values()
+                    # the codes of the existing rows change: new arrays, the old frames keep theirs
+                    recode = merged.get_indexer(categories)
+                    old_codes = codes[:length]
+                    codes = np.where(old_codes < 0, -1, recode[old_codes])
+                    categories = merged
+                new_codes = pd.Categorical(values, categories=categories).codes
+                dtype = np.result_type(codes.dtype, new_codes.dtype)
+                buffer = _append(codes, length, new_codes.astype(dtype))
+                columns[name] = _from_codes(
+                    buffer[:end], dtype=pd.CategoricalDtype(categories)
+                )
+            else:
+                current = self.columns.get(name)
+                if current is None:
+                    current = old.to_numpy()
+                dtype = np.result_type(old.dtype, new.dtype)
+                buffer = _append(current, length, new.to_numpy().astype(dtype))
+                columns[name] = buffer[:end]
+            self.columns[name] = buffer
+
+        self.rows = end
+        return pd.DataFrame(columns, copy=False)
+
+    def extend_country_index(
+        self, index: dict, rows: pd.DataFrame, offset: int
+    ) -> dict:
+        """
+        Returns the country index with the bookings of rows, found at positions starting at offset.
+        """
+        if self.index_rows != offset:
+            self.index = {}
+        extended = dict(index)
+        for country, positions in build_country_index(rows).items():
+            previous = index.get(country, np.array([], dtype=np.intp))
+            buffer = self.index.get(country, previous)
+            buffer = _append(buffer, len(previous), positions + offset)
+            self.index[country] = buffer
+            extended[country] = buffer[: len(previous) + len(positions)]
+        self.index_rows = offset + len(rows)
+        return extended
@@ -0,0 +1,32 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import settings
+from metrics import phase
+
+# bounded pool for the CPU-bound DataFrame work, so it does not block the event loop.
+# threads are used instead of processes: pandas releases the GIL in most of its
+# heavy operations and the workers share the DataFrame without copying it
+executor = ThreadPoolExecutor(
+    max_workers=settings.worker_pool_size, thread_name_prefix="dataframe"
+)
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) in the worker pool and waits for the result without blocking the event loop.
+    The time it takes in the worker is counted in the compute phase of the request.
+    """
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry the context of the request over to the thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, context.run, _timed, partial(func, *args, **kwargs)
+    )
+
+
+def _timed(func):
+    with phase("compute"):
+        return func()
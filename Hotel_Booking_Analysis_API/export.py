@@ -0,0 +1,240 @@
+import pandas as pd
+
+from database import parse_date
+from dataset import SOURCE_COLUMNS
+from executor import run_in_pool
+from schemas import ExportFormat
+
+try:
+    import pyarrow as pa
+except ImportError:  # the Arrow format is optional
+    pa = None
+
+# number of rows read, encoded and sent at once
+EXPORT_CHUNK_SIZE = 10_000
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+}
+
+
+# Arrow types of the columns of the database, by Python type, for the schema of an empty export
+ARROW_TYPES = {} if pa is None else {int: pa.int64(), float: pa.float64()}
+
+
+def _arrow_type(column_type):
+    # text for the columns stored as text, e.g. the ISO dates
+    try:
+        return ARROW_TYPES.get(column_type.python_type, pa.string())
+    except NotImplementedError:
+        return pa.string()
+
+
+class _BytesSink:
+    # file-like object collecting what the Arrow stream writer writes, drained after every batch
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+class ChunkEncoder:
+    """
+    Encodes DataFrame chunks one after another into a single NDJSON, CSV or Arrow IPC stream.
+    schema is the Arrow schema of the stream and columns the header of the CSV file,
+    written alone when there is no chunk, so an empty export still has them.
+    """
+
+    def __init__(self, format: ExportFormat, schema=None, columns=None):
+        self.format = format
+        self.schema = schema
+        self.columns = columns
+        self._header = True
+        self._sink = None
+        self._writer = None
+
+    def encode(self, chunk: pd.DataFrame) -> bytes:
+        if self.format == ExportFormat.ndjson:
+            if chunk.empty:
+                return b""
+            return (
+                chunk.to_json(orient="records", lines=True).rstrip("\n").encode()
+                + b"\n"
+            )
+
+        if self.format == ExportFormat.csv:
+            data = chunk.to_csv(index=False, header=self._header).encode()
+            self._header = False
+            return data
+
+        batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._open(batch.schema)
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def _open(self, schema) -> None:
+        self._sink = _BytesSink()
+        self._writer = pa.ipc.new_stream(pa.PythonFile(self._sink, mode="w"), schema)
+
+    def close(self) -> bytes:
+        if self.format == ExportFormat.csv:
+            if self._header and self.columns is not None:
+                return self.encode(pd.DataFrame(columns=self.columns))
+            return b""
+        if self._writer is None:
+            if self.format != ExportFormat.arrow or self.schema is None:
+                return b""
+            self._open(self.schema)
+        self._writer.close()
+        return self._sink.drain()
+
+
+def frame_filters(
+    guest_name=None,
+    booking_date=None,
+    length_of_stay=None,
+    date_from=None,
+    date_to=None,
+    min_stay=None,
+    max_stay=None,
+    min_rate=None,
+    max_rate=None,
+) -> dict:
+    """
+    Returns the filters of /bookings/search/ for frame_mask, with the dates parsed,
+    so a malformed filter is rejected before the export starts. Raises FilterError.
+    """
+    return {
+        "guest_name": guest_name,
+        "booking_date": (
+            [parse_date(value, "booking_date") for value in booking_date]
+            if booking_date
+            else None
+        ),
+        "length_of_stay": length_of_stay,
+        "date_from": parse_date(date_from, "date_from") if date_from else None,
+        "date_to": parse_date(date_to, "date_to") if date_to else None,
+        "min_stay": min_stay,
+        "max_stay": max_stay,
+        "min_rate": min_rate,
+        "max_rate": max_rate,
+    }
+
+
+def _between(series: pd.Series, low, high) -> pd.Series:
+    mask = pd.Series(True, index=series.index)
+    if low is not None:
+        mask &= series >= low
+    if high is not None:
+        mask &= series <= high
+    return mask
+
+
+def frame_mask(
+    chunk: pd.DataFrame,
+    guest_name=None,
+    booking_date=None,
+    length_of_stay=None,
+    date_from=None,
+    date_to=None,
+    min_stay=None,
+    max_stay=None,
+    min_rate=None,
+    max_rate=None,
+) -> pd.Series:
+    """
+    Selects the rows of a chunk of the dataset matching the filters of frame_filters:
+    the lists match any of their values, the bounds are inclusive, as in /bookings/search/.
+    """
+    mask = pd.Series(True, index=chunk.index)
+
+    if guest_name is not None:
+        mask &= chunk["name"].isin(guest_name)
+
+    if booking_date:
+        mask &= chunk["arrival_date"].isin(pd.to_datetime(booking_date))
+
+    if length_of_stay is not None:
+        mask &= chunk["length_of_stay"].isin(length_of_stay)
+
+    if date_from is not None or date_to is not None:
+        mask &= _between(
+            chunk["arrival_date"],
+            pd.Timestamp(date_from) if date_from else None,
+            pd.Timestamp(date_to) if date_to else None,
+        )
+
+    if min_stay is not None or max_stay is not None:
+        mask &= _between(chunk["length_of_stay"], min_stay, max_stay)
+
+    if min_rate is not None or max_rate is not None:
+        mask &= _between(chunk["adr"], min_rate, max_rate)
+
+    return mask
+
+
+def export_frame(df: pd.DataFrame, format: ExportFormat, rows=None, **filters):
+    """
+    Yields the rows of the dataset matching the filters, encoded chunk by chunk, with the columns of the csv file.
+    rows limits the export to the given row positions, e.g. from the country index.
+    Only one chunk is filtered and encoded at a time, so memory does not grow with the result.
+    """
+    schema = None
+    if format == ExportFormat.arrow:
+        schema = pa.Schema.from_pandas(
+            df.iloc[:0][SOURCE_COLUMNS], preserve_index=False
+        )
+    encoder = ChunkEncoder(format, schema, SOURCE_COLUMNS)
+    total = len(df) if rows is None else len(rows)
+    for start in range(0, total, EXPORT_CHUNK_SIZE):
+        if rows is None:
+            chunk = df.iloc[start : start + EXPORT_CHUNK_SIZE]
+        else:
+            chunk = df.iloc[rows[start : start + EXPORT_CHUNK_SIZE]]
+        data = encoder.encode(chunk.loc[frame_mask(chunk, **filters), SOURCE_COLUMNS])
+        if data:
+            yield data
+    yield encoder.close()
+
+
+async def export_query(engine, query, format: ExportFormat):
+    """
+    Yields the rows of a query, encoded chunk by chunk.
+    The rows are fetched from a server-side cursor on a connection of its own,
+    and the encoding runs in the worker pool.
+    """
+    schema = None
+    if format == ExportFormat.arrow:
+        schema = pa.schema(
+            [
+                (column.name, _arrow_type(column.type))
+                for column in query.selected_columns
+            ]
+        )
+    columns = [column.name for column in query.selected_columns]
+    encoder = ChunkEncoder(format, schema, columns)
+    async with engine.connect() as connection:
+        result = await connection.stream(query)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            chunk = pd.DataFrame.from_records(rows, columns=list(result.keys()))
+            data = await run_in_pool(encoder.encode, chunk)
+            if data:
+                yield data
+    yield encoder.close()
@@ -1,87 +1,216 @@
 from authentication import *
 from schemas import *
+from aggregation import AggregationError, create_backend, normalize_query, query_key
+from cache import create_cache
+from caching import ResponseCacheMiddleware
+from config import settings
+from bundle import build_bundle, extend_bundle, refresh_bundle
+from database import Booking, StaleDatasetError, async_db_engine, db_engine, get_db
+from database import stored_version
+from database import FilterError, search_filters, search_query
+from dataset import SOURCE_COLUMNS, file_stat
+from executor import executor, run_in_pool
+from export import MEDIA_TYPES, export_frame, export_query, frame_filters, pa
+from metrics import Metrics, MetricsMiddleware, instrument_engine
+from pagination import cursor_date, cursor_int, decode_cursor, encode_cursor
+from profiling import ProfilingMiddleware
+from serialization import respond
+from snapshot import AGGREGATES
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, Query, Security, Path
+from typing import List, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Security, Path, Response
+from fastapi import BackgroundTasks
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBasicCredentials
+from pydantic import conint, constr
 
-from sqlalchemy import create_engine, Column, Integer, String, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.types import TypeDecorator
-from sqlalchemy import DateTime
+from sqlalchemy import and_, case, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import asyncio
+import logging
+import threading
 
 import pandas as pd
 
 import uvicorn
 
-# create bd SQLite
-DATABASE_URL = "sqlite:///hotel.db"
-db_engine = create_engine(DATABASE_URL)
-
-# defining the schema of the "bookings" table
-Base = declarative_base()
-
+# uvicorn only configures its own loggers: without a handler on the root logger,
+# the messages of the API below WARNING would be dropped
+logging.basicConfig(
+    level=settings.log_level, format="%(levelname)s:     %(name)s: %(message)s"
+)
+log = logging.getLogger(__name__)
+
+# cache of the computed aggregates and responses
+cache = create_cache(
+    settings.cache_backend,
+    settings.cache_path,
+    settings.cache_max_entries,
+    settings.cache_max_bytes,
+    settings.cache_ttl,
+    settings.cache_eviction,
+)
 
-# create custom data type for date conversion
-class CustomDateTime(TypeDecorator):
-    impl = DateTime
+# engine of the ad-hoc aggregations and of the analytics endpoints
+analytics = create_backend(settings.analytics_backend, settings.analytics_threads)
 
-    def process_result_value(self, value, dialect):
-        if value is not None:
-            return value.strftime("%Y-%m-%d")
-        return None
+# load the csv file in the "bookings" table and into a pandas DataFrame, unless they are current,
+# and precompute the country index and the results of the analytics endpoints.
+# a request reads this reference once and uses that bundle to the end
+dataset = build_bundle(
+    settings.dataset_path, settings.dataset_cache_path, cache, analytics
+)
 
+# one reload or append at a time, and which one is running: "reload" or "append"
+_reload_lock = threading.Lock()
+_running = None
 
-# create table
-class Booking(Base):
-    __tablename__ = "bookings"
 
-    id = Column(Integer, primary_key=True, index=True)
-    booking_date = Column(CustomDateTime)
-    length_of_stay = Column(Integer)
-    guest_name = Column(String)
-    daily_rate = Column(Float)
+def reload_dataset() -> bool:
+    """
+    Builds the bundle of the current csv file next to the one in use and swaps it in:
+    nothing is rebuilt if the version did not change, and the rows appended by other workers
+    are added to the bundle in use. Returns False if another reload is running.
+    """
+    global dataset, _running
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    _running = "reload"
+    try:
+        bundle = refresh_bundle(
+            dataset,
+            settings.dataset_path,
+            settings.dataset_cache_path,
+            cache,
+            analytics,
+        )
+        if bundle.version != dataset.version:
+            log.info("dataset reloaded: %s -> %s", dataset.version, bundle.version)
+        dataset = bundle
+        return True
+    finally:
+        _running = None
+        _reload_lock.release()
 
 
-# create the table in db
-Base.metadata.create_all(bind=db_engine)
+def append_dataset(raw: pd.DataFrame) -> str:
+    """
+    Appends rows to the dataset and swaps in the bundle of the new version, which is returned:
+    with the rows other workers appended before, taken in first.
+    Waits for a running reload or append to finish first.
+    """
+    global dataset, _running
+    with _reload_lock:
+        _running = "append"
+        try:
+            dataset = extend_bundle(
+                dataset,
+                settings.dataset_path,
+                raw,
+                settings.dataset_cache_path,
+                cache,
+                analytics,
+            )
+            return dataset.version
+        finally:
+            _running = None
+
+
+async def watch_dataset(interval: float) -> None:
+    # reloads the dataset when the size or the modification time of the csv file changes
+    stat = file_stat(settings.dataset_path)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = file_stat(settings.dataset_path)
+            if current != stat:
+                await run_in_pool(reload_dataset)
+                stat = current
+        except Exception:
+            log.exception("dataset reload failed")
+
+
+async def sync_dataset(interval: float) -> None:
+    # takes in the rows appended by the other workers, as soon as the stored version changes
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await run_in_pool(stored_version) != dataset.version:
+                await run_in_pool(reload_dataset)
+        except Exception:
+            log.exception("dataset sync failed")
 
-# create a session to work with the database
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
-session = SessionLocal()
 
-# load the dataset into a pandas DataFrame
-df = pd.read_csv("hotel_booking_data.csv")
+# set up the FastAPI application
+app = FastAPI(title="Hotel Booking Analysis API")
 
-# create, filter DataFrame for the db
-df1 = df.copy()
-df1["id"] = range(1, len(df1) + 1)
-df1["booking_date"] = pd.to_datetime(
-    df1["arrival_date_year"].astype(str)
-    + "-"
-    + df1["arrival_date_month"]
-    + "-"
-    + df1["arrival_date_day_of_month"].astype(str)
+# routes whose responses only change with the dataset, cached by ETag and in memory
+CACHED_PATHS = [
+    "/bookings/stats/",
+    "/bookings/analysis/",
+    "/bookings/nationality/",
+    "/bookings/popular_meal_package/",
+    "/bookings/avg_length_of_stay/",
+    "/bookings/total_revenue/",
+    "/bookings/top_countries/",
+    "/bookings/repeated_guests_percentage/",
+    "/bookings/total_guests_by_year/",
+    "/bookings/avg_daily_rate_resort/",
+    "/bookings/most_common_arrival_day_city/",
+    "/bookings/count_by_hotel_meal/",
+    "/bookings/total_revenue_resort_by_country/",
+    "/bookings/count_by_hotel_repeated_guest/",
+    "/bookings/aggregate/",
+]
+app.add_middleware(
+    ResponseCacheMiddleware,
+    paths=CACHED_PATHS,
+    version=lambda: dataset.version,
+    cache=cache,
+    max_age=settings.response_cache_max_age,
 )
-df1["length_of_stay"] = df1.stays_in_weekend_nights + df1.stays_in_week_nights
-df1["guest_name"] = df1.name
-df1["daily_rate"] = df1.adr
-df1 = df1[["id", "booking_date", "length_of_stay", "guest_name", "daily_rate"]]
 
-# load df1 in the table
-df1.to_sql("bookings", con=db_engine, if_exists="replace", index=False)
+# metrics of the requests of this worker, outermost so responses from the cache are counted too
+metrics = Metrics()
+if settings.metrics_enabled:
+    instrument_engine(db_engine)
+    instrument_engine(async_db_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes)
+
+# profiling of single requests, only installed when enabled
+if settings.profiling_token or settings.profiling_sample_rate > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.profiling_dir,
+        token=settings.profiling_token,
+        sample_rate=settings.profiling_sample_rate,
+        interval=settings.profiling_interval,
+    )
 
-# set up the FastAPI application
-app = FastAPI(title="Hotel Booking Analysis API")
+
+# follow the appends of the other workers and watch the csv file, if enabled
+@app.on_event("startup")
+async def startup():
+    if settings.dataset_sync_interval:
+        app.state.sync = asyncio.create_task(
+            sync_dataset(settings.dataset_sync_interval)
+        )
+    if settings.dataset_watch_interval:
+        app.state.watcher = asyncio.create_task(
+            watch_dataset(settings.dataset_watch_interval)
+        )
 
 
-# dependency function to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# release the worker pool and the database connections on shutdown
+@app.on_event("shutdown")
+async def shutdown():
+    for name in ("sync", "watcher"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    executor.shutdown(wait=False)
+    await async_db_engine.dispose()
 
 
 # URL_1
@@ -93,16 +222,25 @@ def get_db():
     status_code=200,
 )
 async def get_all_bookings(
+    response: Response,
     skip: int = Query(0, description="Skip a number of bookings", ge=0),
     limit: int = Query(
         10, description="Limit the number of bookings to retrieve", ge=0, le=100
     ),
-    db: Session = Depends(get_db),
+    cursor: str = Query(
+        None, description="Cursor from the X-Next-Cursor header of the previous page"
+    ),
+    order_by: BookingOrder = Query(BookingOrder.id, description="Sort order"),
+    db: AsyncSession = Depends(get_db),
 ) -> list:
     """
     Retrieves a list of all bookings in the dataset.
     Since the database is very large, and the task is to show all bookings, a restriction on display on the page has been introduced - the 'limit' parameter
 
+    Pages are ordered by id, or by booking_date and id. A full page returns the X-Next-Cursor header:
+    passing it as the 'cursor' parameter continues right after the page through the index, whatever its depth.
+    The 'skip' parameter is kept for compatibility: it is applied after the cursor and costs a walk over the skipped rows.
+
     return: list of the dict with data: booking_date, id, length_of_stay, daily_rate, guest_name.
 
     Expected response format:
@@ -119,9 +257,33 @@ async def get_all_bookings(
 
     HTTP Response Codes:
     - 200 OK: Successfully received the total number of guests.
+    - 400 Bad Request: Invalid cursor.
     - 500 Internal Server Error: Internal server error.
     """
-    bookings = db.query(Booking).offset(skip).limit(limit).all()
+    if order_by == BookingOrder.booking_date:
+        sort_key = [Booking.booking_date, Booking.id]
+        key_types = [cursor_date, cursor_int]
+    else:
+        sort_key = [Booking.id]
+        key_types = [cursor_int]
+
+    query = select(*Booking.__table__.columns).order_by(*sort_key)
+
+    # continue after the last row of the previous page
+    if cursor is not None:
+        key = decode_cursor(cursor, order_by.value, key_types)
+        query = query.where(tuple_(*sort_key) > tuple(key))
+
+    result = await db.execute(query.offset(skip).limit(limit))
+    bookings = [dict(row) for row in result.mappings()]
+
+    if bookings and len(bookings) == limit:
+        key = [bookings[-1][column.key] for column in sort_key]
+        response.headers["X-Next-Cursor"] = encode_cursor(order_by.value, key)
+
+    bookings = respond(bookings, list[BookingAllResponse])
+    if isinstance(bookings, Response):
+        bookings.headers.update(response.headers)
     return bookings
 
 
@@ -134,7 +296,8 @@ async def get_all_bookings(
     status_code=200,
 )
 async def get_booking_id(
-    booking_id: int = Path(..., description="ID", ge=1), db: Session = Depends(get_db)
+    booking_id: int = Path(..., description="ID", ge=1),
+    db: AsyncSession = Depends(get_db),
 ) -> dict:
     """
     Retrieves details of a specific booking by its unique ID.
@@ -160,7 +323,7 @@ async def get_booking_id(
     - 404 Not Found.
     """
 
-    booking = db.query(Booking).get(booking_id)
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     return booking
@@ -174,17 +337,38 @@ async def get_booking_id(
     status_code=200,
 )
 async def search_bookings(
-    guest_name: str = Query(
-        None, description="Guest name", min_length=2, max_length=20
+    guest_name: Optional[List[constr(min_length=2, max_length=20)]] = Query(
+        None, description="Guest name, repeat the parameter to match any of several"
+    ),
+    booking_date: Optional[List[constr(max_length=10)]] = Query(
+        None,
+        description="Booking date. Format: y-m-d: 0000-00-00, repeat the parameter to match any of several",
+    ),
+    length_of_stay: Optional[List[conint(ge=0)]] = Query(
+        None, description="Length of stay, repeat the parameter to match any of several"
+    ),
+    date_from: str = Query(
+        None, description="First booking date. Format: y-m-d: 0000-00-00", max_length=10
+    ),
+    date_to: str = Query(
+        None, description="Last booking date. Format: y-m-d: 0000-00-00", max_length=10
     ),
-    booking_date: str = Query(
-        None, description="Booking date. Format: y-m-d: 0000-00-00", max_length=10
+    min_stay: int = Query(None, description="Minimum length of stay", ge=0),
+    max_stay: int = Query(None, description="Maximum length of stay", ge=0),
+    min_rate: float = Query(None, description="Minimum daily rate"),
+    max_rate: float = Query(None, description="Maximum daily rate"),
+    skip: int = Query(0, description="Skip a number of bookings", ge=0),
+    limit: int = Query(
+        100, description="Limit the number of bookings to retrieve", ge=0, le=1000
     ),
-    length_of_stay: int = Query(None, description="Length of stay", ge=0),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Allows searching for bookings based on various parameters such as guest name, booking dates, length of stay.
+    Guest names, booking dates and lengths of stay match any of the given values,
+    the date_from/date_to, min_stay/max_stay and min_rate/max_rate bounds are inclusive.
+    Every filter is served by an index of the "bookings" table, so the matching bookings are found without a full scan.
+    The matching bookings are returned page by page, ordered by id - the 'skip' and 'limit' parameters.
 
     return: dict with data: booking_date, id, length_of_stay, daily_rate, guest_name.
 
@@ -202,30 +386,52 @@ async def search_bookings(
 
     HTTP Response Codes:
     - 200 OK: Successfully received the total number of guests.
-    - 400 Bad Request: Guest not found or Date not found or Length of stay not found
+    - 400 Bad Request: Guest not found or Date not found or Length of stay not found or Daily rate not found,
+      or a malformed date.
     """
 
-    query = db.query(Booking)
+    try:
+        filters = search_filters(
+            guest_name,
+            booking_date,
+            length_of_stay,
+            date_from=date_from,
+            date_to=date_to,
+            min_stay=min_stay,
+            max_stay=max_stay,
+            min_rate=min_rate,
+            max_rate=max_rate,
+        )
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await db.execute(search_query(filters).offset(skip).limit(limit))
+    bookings = [dict(row) for row in result.mappings()]
 
-    if guest_name is not None:
-        query = query.filter(Booking.guest_name == guest_name)
-        existing_guest = query.first()
-        if existing_guest is None:
-            raise HTTPException(status_code=400, detail="Guest not found")
+    # an empty page: find out which filter left no bookings
+    if not bookings and filters:
+        detail = await find_failed_filter(db, filters)
+        if detail is not None:
+            raise HTTPException(status_code=400, detail=detail)
 
-    if booking_date:
-        date_obj = datetime.strptime(booking_date, "%Y-%m-%d").date()
-        query = query.filter(Booking.booking_date == date_obj)
-        if not query.first():
-            raise HTTPException(status_code=400, detail="Date not found")
+    return respond(bookings, list[BookingAllResponse])
 
-    if length_of_stay is not None:
-        query = query.filter(Booking.length_of_stay == length_of_stay)
-        if not query.first():
-            raise HTTPException(status_code=400, detail="Length of stay not found")
 
-    bookings = query.all()
-    return bookings
+async def find_failed_filter(db: AsyncSession, filters: list):
+    """
+    Returns the error of the first filter that leaves no bookings when applied together with the filters before it,
+    or None if all of them match. Answered by one grouped existence check over the rows passing the first filter.
+    """
+    conditions = [condition for condition, detail in filters]
+    checks = [
+        func.max(case((and_(*conditions[: i + 1]), 1), else_=0))
+        for i in range(len(conditions))
+    ]
+    found = (await db.execute(select(*checks).where(conditions[0]))).one()
+
+    for exists, (condition, detail) in zip(found, filters):
+        if not exists:
+            return detail
+    return None
 
 
 # URL_4
@@ -255,19 +461,7 @@ async def get_stats() -> dict:
     - 500 Internal Server Error: Internal server error.
     """
     try:
-        total_bookigs = df.shape[0]
-        new_df = df.copy()
-        new_df["length_of_stay"] = (
-            new_df.stays_in_weekend_nights + new_df.stays_in_week_nights
-        )
-        average_length_of_stay = new_df.length_of_stay.mean()
-        average_daily_rate = new_df.adr.mean()
-
-        return {
-            "total_bookigs": total_bookigs,
-            "average_length_of_stay": average_length_of_stay,
-            "average_daily_rate": average_daily_rate,
-        }
+        return dataset.snapshot["stats"]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -281,17 +475,21 @@ async def get_stats() -> dict:
     tags=["Bookings"],
 )
 async def perform_advanced_analysis(
-    request_data: Choice = Query(description="Your choice"),
+    request_data: List[Choice] = Query(
+        description="Your choice, repeat the parameter to get several analyses at once"
+    ),
 ) -> dict:
     """
     Performs advanced analysis on the dataset, generating insights and trends based on specific criteria, such as booking trends by month, guest demographics, popular meal packages, etc.
+    Several analyses can be requested in one call. Each one is an aggregate of the snapshot,
+    computed once per version of the dataset, so combining them costs no extra pass over the data.
 
-    Parameter to choose:
+    Parameter to choose, one or several:
     booking_trends_by_month
     guest_demographics
     popular_meal_packages
 
-    return: dict with data.
+    return: dict with data, one key per chosen analysis.
 
 
     HTTP Response Codes:
@@ -299,29 +497,14 @@ async def perform_advanced_analysis(
     - 400 Bad Request.
     """
 
+    snapshot = dataset.snapshot
     result = {}
 
-    if request_data == Choice.booking_trends_by_month:
-        # Calculate booking trends by month
-        booking_trends = df["arrival_date_month"].value_counts().to_dict()
-        result["booking_trends_by_month"] = booking_trends
-
-    elif request_data == Choice.guest_demographics:
-        # Calculate guest demographics
-        demographics = {
-            "total_adults": int(df["adults"].sum()),
-            "total_children": int(df["children"].sum()),
-            "total_babies": int(df["babies"].sum()),
-        }
-        result["guest_demographics"] = demographics
-
-    elif request_data == Choice.popular_meal_packages:
-        # Calculate popular meal packages
-        meal_packages = df["meal"].value_counts().to_dict()
-        result["popular_meal_packages"] = meal_packages
-
-    else:
-        raise HTTPException(status_code=400, detail="Invalid analysis_type")
+    # every choice is registered in AGGREGATES under its own name
+    for choice in request_data:
+        if choice.value not in AGGREGATES:
+            raise HTTPException(status_code=400, detail="Invalid analysis_type")
+        result[choice.value] = snapshot[choice.value]
 
     return {"result": result}
 
@@ -330,21 +513,37 @@ async def perform_advanced_analysis(
 @app.get(
     "/bookings/nationality/",
     summary="Get a sample by nationality",
+    response_model=NationalityResponse,
     tags=["Bookings"],
     status_code=200,
 )
 async def get_nationality(
     nationality: str = Query(
         description="Must not exceed 3 big letters", min_length=2, max_length=3
-    )
-):
+    ),
+    skip: int = Query(0, description="Skip a number of bookings", ge=0),
+    limit: int = Query(
+        100, description="Limit the number of bookings to retrieve", ge=0, le=1000
+    ),
+) -> dict:
     """
     Retrieves bookings based on the provided nationality.
+    The bookings are returned page by page - the 'skip' and 'limit' parameters.
+    All bookings of a nationality at once are streamed by /bookings/export/?source=dataframe&nationality=...
 
     Parameters:
     nationality (str): The nationality for which to retrieve bookings. Must not exceed 3 big letters.
 
-    return: The bookings matching the provided nationality.
+    return: The bookings matching the provided nationality and their total number.
+
+    Expected response format:
+    {
+     "nationality": "string",
+     "total": 0,
+     "skip": 0,
+     "limit": 0,
+     "bookings": [{"hotel": "string", ..., "name": "string"}]
+    }
 
 
     HTTP Response Codes:
@@ -355,17 +554,26 @@ async def get_nationality(
 
     if len(nationality) > 3:
         raise HTTPException(status_code=400, detail="Must not exceed 3 big letters")
-    if nationality not in df.country.unique():
-        raise HTTPException(status_code=404, detail="Invalid nationality")
 
-    national = df.query("country == @nationality")
+    current = dataset
 
-    if len(national) == 0:
-        raise HTTPException(
-            status_code=404, detail=f"No bookings found for nationality: {nationality}"
-        )
+    # positions of the bookings of the nationality, found without scanning the DataFrame
+    positions = current.country_index.get(nationality)
+    if positions is None:
+        raise HTTPException(status_code=404, detail="Invalid nationality")
 
-    return national.to_json()
+    return respond(
+        {
+            "nationality": nationality,
+            "total": len(positions),
+            "skip": skip,
+            "limit": limit,
+            "bookings": current.df.iloc[positions[skip : skip + limit]][
+                SOURCE_COLUMNS
+            ].to_dict("records"),
+        },
+        NationalityResponse,
+    )
 
 
 # URL_7
@@ -391,7 +599,7 @@ async def get_popular_meal_package() -> dict:
     """
 
     try:
-        return {"popular_meal_package": df.meal.value_counts().index[0]}
+        return dataset.snapshot["popular_meal_package"]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -425,15 +633,9 @@ async def get_avg_length_of_stay() -> list:
      - 500 Internal Server Error: Internal server error.
     """
     try:
-        new_df = df.copy()
-        new_df["length_of_stay"] = (
-            new_df.stays_in_weekend_nights + new_df.stays_in_week_nights
-        )
-        return (
-            new_df.groupby(["hotel", "arrival_date_year"])["length_of_stay"]
-            .mean()
-            .reset_index(name="average_stay")
-            .to_dict("records")
+        return respond(
+            dataset.snapshot["avg_length_of_stay"],
+            list[AvgLengthOfStay],
         )
 
     except Exception as e:
@@ -468,12 +670,9 @@ async def get_total_revenue() -> list:
     - 500 Internal Server Error: Internal server error.
     """
     try:
-        return (
-            df.groupby(["hotel", "arrival_date_month"])["adr"]
-            .sum()
-            .reset_index(name="total_revenue")
-            .rename(columns={"arrival_date_month": "month"})
-            .to_dict("records")
+        return respond(
+            dataset.snapshot["total_revenue"],
+            list[TotalRevenue],
         )
 
     except Exception as e:
@@ -508,11 +707,9 @@ async def get_top_countries() -> list:
     """
 
     try:
-        return (
-            df.country.value_counts()
-            .head()
-            .reset_index(name="number_of_bookings")
-            .to_dict("records")
+        return respond(
+            dataset.snapshot["top_countries"],
+            list[TopCountries],
         )
 
     except Exception as e:
@@ -542,12 +739,7 @@ async def get_repeated_guests_percentage() -> dict:
     """
 
     try:
-        percent_repeat = (
-            df.is_repeated_guest.value_counts()[1]
-            / df.is_repeated_guest.value_counts()[0]
-            * 100
-        )
-        return {"percentage_repeated_guests": percent_repeat}
+        return dataset.snapshot["repeated_guests_percentage"]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -581,20 +773,11 @@ async def get_total_guests_by_year() -> list:
     """
 
     try:
-        # group and filter by specified conditions
-        total_number = (
-            df.groupby("arrival_date_year")[["adults", "children", "babies"]]
-            .sum()
-            .sum(axis=1)
-            .reset_index(name="total_guests")
-            .rename(columns={"arrival_date_year": "year"})
+        return respond(
+            dataset.snapshot["total_guests_by_year"],
+            list[TotalGuestsByYearResponse],
         )
 
-        # transform the data into the format corresponding to the expected response
-        count_data_response = total_number.to_dict("records")
-
-        return count_data_response
-
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
@@ -629,13 +812,9 @@ async def get_avg_daily_rate_resort(
     """
 
     try:
-        new_df = df.query("hotel == 'Resort Hotel'")
-
-        return (
-            new_df.groupby("arrival_date_month")["adr"]
-            .mean()
-            .reset_index(name="average_daily_rate")
-            .to_dict(orient="records")
+        return respond(
+            dataset.snapshot["avg_daily_rate_resort"],
+            list[AvgDailyRateResort],
         )
 
     except Exception as e:
@@ -667,24 +846,7 @@ async def get_most_common_arrival_day_city(
     """
 
     try:
-        new_df = df.query("hotel == 'City Hotel'")
-
-        # creating a new column with conversion to date format  --> 2015-07-01
-        new_df["arrival_date"] = pd.to_datetime(
-            new_df["arrival_date_year"].astype(str)
-            + "-"
-            + new_df["arrival_date_month"]
-            + "-"
-            + new_df["arrival_date_day_of_month"].astype(str)
-        )
-
-        # creating a new column with conversion to date-of-day format --> Wednesday
-        new_df["day_of_week"] = new_df.arrival_date.dt.day_name()
-
-        # finding the most common day of the week
-        most_common_day = new_df.day_of_week.mode().values[0]
-
-        return {"most_common_day": most_common_day}
+        return dataset.snapshot["most_common_arrival_day_city"]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -721,11 +883,9 @@ async def get_count_by_hotel_meal(
     """
 
     try:
-        return (
-            df.groupby(["hotel", "meal"])
-            .size()
-            .reset_index(name="count")
-            .to_dict(orient="records")
+        return respond(
+            dataset.snapshot["count_by_hotel_meal"],
+            list[CountByHotelMeal],
         )
 
     except Exception as e:
@@ -761,13 +921,9 @@ async def get_total_revenue_resort_by_country(
     - 500 Internal Server Error: Internal server error.
     """
     try:
-        new_df = df.query("hotel == 'Resort Hotel'")
-
-        return (
-            new_df.groupby("country")["adr"]
-            .sum()
-            .reset_index(name="total_revenue")
-            .to_dict(orient="records")
+        return respond(
+            dataset.snapshot["total_revenue_resort_by_country"],
+            list[TotalRevenueResortByCountry],
         )
 
     except Exception as e:
@@ -805,17 +961,359 @@ async def get_count_by_hotel_repeated_guest(
     """
 
     try:
-        return (
-            df.groupby(["hotel", "is_repeated_guest"])
-            .size()
-            .reset_index(name="count")
-            .to_dict(orient="records")
+        return respond(
+            dataset.snapshot["count_by_hotel_repeated_guest"],
+            list[CountByHotelRepeatedGuestResponse],
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+# URL_18
+@app.get(
+    "/bookings/export/",
+    summary="Export bookings",
+    tags=["Bookings"],
+    status_code=200,
+)
+async def export_bookings(
+    format: ExportFormat = Query(ExportFormat.ndjson, description="Output format"),
+    source: ExportSource = Query(
+        ExportSource.database,
+        description="database: the bookings table, dataframe: all columns of the dataset",
+    ),
+    guest_name: Optional[List[constr(min_length=2, max_length=20)]] = Query(
+        None, description="Guest name, repeat the parameter to match any of several"
+    ),
+    booking_date: Optional[List[constr(max_length=10)]] = Query(
+        None,
+        description="Booking date. Format: y-m-d: 0000-00-00, repeat the parameter to match any of several",
+    ),
+    length_of_stay: Optional[List[conint(ge=0)]] = Query(
+        None, description="Length of stay, repeat the parameter to match any of several"
+    ),
+    date_from: str = Query(
+        None, description="First booking date. Format: y-m-d: 0000-00-00", max_length=10
+    ),
+    date_to: str = Query(
+        None, description="Last booking date. Format: y-m-d: 0000-00-00", max_length=10
+    ),
+    min_stay: int = Query(None, description="Minimum length of stay", ge=0),
+    max_stay: int = Query(None, description="Maximum length of stay", ge=0),
+    min_rate: float = Query(None, description="Minimum daily rate"),
+    max_rate: float = Query(None, description="Maximum daily rate"),
+    nationality: str = Query(
+        None,
+        description="Must not exceed 3 big letters, dataframe source only",
+        min_length=2,
+        max_length=3,
+    ),
+) -> StreamingResponse:
+    """
+    Streams all bookings matching the filters, whatever their number, as NDJSON, CSV or an Arrow IPC stream.
+    The filters are the ones of /bookings/search/ and /bookings/nationality/.
+    They are all checked before the stream starts, so a malformed one is answered with 400, not a cut-off body.
+    Rows are read and encoded chunk by chunk, so memory use does not depend on the size of the result.
+
+    return: stream of rows: booking_date, id, length_of_stay, daily_rate, guest_name for the database source,
+    all columns of the dataset for the dataframe source.
+
+    HTTP Response Codes:
+    - 200 OK: Successfully started the export.
+    - 400 Bad Request: Malformed date, or nationality filter with the database source.
+    - 404 Not Found: Nationality without bookings, as in /bookings/nationality/.
+    - 501 Not Implemented: Arrow format without pyarrow installed.
+    """
+
+    if format == ExportFormat.arrow and pa is None:
+        raise HTTPException(status_code=501, detail="Arrow export needs pyarrow")
+
+    if nationality is not None and source == ExportSource.database:
+        raise HTTPException(
+            status_code=400, detail="Nationality needs the dataframe source"
+        )
+
+    search = {
+        "guest_name": guest_name,
+        "booking_date": booking_date,
+        "length_of_stay": length_of_stay,
+        "date_from": date_from,
+        "date_to": date_to,
+        "min_stay": min_stay,
+        "max_stay": max_stay,
+        "min_rate": min_rate,
+        "max_rate": max_rate,
+    }
+    try:
+        if source == ExportSource.dataframe:
+            filters = frame_filters(**search)
+        else:
+            filters = search_filters(**search)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if source == ExportSource.dataframe:
+        # only the rows of the nationality are visited, through the country index
+        # the stream keeps the bundle it started with, even if the dataset is reloaded meanwhile
+        current = dataset
+        rows = None
+        if nationality is not None:
+            rows = current.country_index.get(nationality)
+            if rows is None:
+                raise HTTPException(status_code=404, detail="Invalid nationality")
+        chunks = export_frame(current.df, format, rows, **filters)
+    else:
+        query = (
+            select(*Booking.__table__.columns)
+            .where(*[condition for condition, detail in filters])
+            .order_by(Booking.id)
+        )
+        chunks = export_query(async_db_engine, query, format)
+
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename=bookings.{format.value}"
+        },
+    )
+
+
+# URL_19
+@app.get(
+    "/cache/stats/",
+    summary="Get cache statistics",
+    response_model=CacheStats,
+    tags=["Service"],
+    status_code=200,
+)
+async def get_cache_stats(
+    credentials: HTTPBasicCredentials = Security(verify_credentials),
+) -> dict:
+    """
+    Retrieves the statistics of the cache of aggregates and responses.
+
+    Return: the backend, the hits, misses and evictions of this worker, the number and size of the entries.
+
+    Expected response format:
+    {
+     "backend": "string",
+     "hits": 0,
+     "misses": 0,
+     "evictions": 0,
+     "entries": 0,
+     "bytes": 0
+    }
+
+    HTTP Response Codes:
+    - 200 OK: Successfully received the cache statistics.
+    - 401 Unauthorized.
+    """
+    if cache.blocking:
+        return await run_in_pool(cache.stats)
+    return cache.stats()
+
+
+# URL_20
+@app.get(
+    "/bookings/aggregate/",
+    summary="Aggregate bookings",
+    response_model=AggregateResponse,
+    tags=["Bookings"],
+    status_code=200,
+)
+async def aggregate_bookings(
+    group_by: Optional[List[str]] = Query(
+        None, description="Column to group by, repeat the parameter for several"
+    ),
+    filters: Optional[List[str]] = Query(
+        None,
+        alias="filter",
+        description="Filter column:value, values of one column are alternatives",
+    ),
+    metrics: Optional[List[str]] = Query(
+        None,
+        alias="metric",
+        description="count or function:column, function one of sum, mean, min, max",
+    ),
+    order_by: Optional[List[str]] = Query(
+        None,
+        description="Group-by column or metric to order by, - first for descending",
+    ),
+    limit: Optional[int] = Query(None, description="Number of rows returned", ge=1),
+    credentials: HTTPBasicCredentials = Security(verify_credentials),
+) -> dict:
+    """
+    Groups the bookings by the given columns and computes the metrics of every group in one pass,
+    e.g. group_by=hotel&group_by=arrival_date_month&metric=sum:adr&metric=count
+    answers what /bookings/total_revenue/ does, plus the number of bookings,
+    and group_by=country&order_by=-count&limit=5 what /bookings/top_countries/ does.
+    Columns, filters and metrics are limited to a whitelist. The query runs on the analytics backend
+    of the settings, pandas or DuckDB; its result is computed once per version of the dataset and shared through the cache.
+
+    return: dict with the normalized query and the rows: group-by columns and one key per metric.
+
+    Expected response format:
+    {
+     "group_by": ["string"],
+     "filters": {"string": ["string"]},
+     "metrics": ["string"],
+     "order_by": ["string"],
+     "limit": 0,
+     "rows": [{"string": "string", "count": 0}]
+    }
+
+    HTTP Response Codes:
+    - 200 OK: Successfully computed the aggregation.
+    - 400 Bad Request: Column, filter, metric or order outside the whitelist.
+    - 401 Unauthorized.
+    """
+    try:
+        query = normalize_query(
+            group_by or [], filters or [], metrics or [], order_by or [], limit
+        )
+    except AggregationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    current = dataset
+    key = query_key(query, current.version)
+    rows = await cache.get_object_async(key)
+    if rows is None:
+        try:
+            rows = await run_in_pool(analytics.aggregate, current.df, query)
+        except AggregationError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await cache.set_object_async(key, rows)
+
+    return respond({**query, "rows": rows}, AggregateResponse)
+
+
+# URL_21
+@app.post(
+    "/dataset/reload/",
+    summary="Reload the dataset",
+    response_model=ReloadResponse,
+    tags=["Service"],
+    status_code=202,
+)
+async def reload_dataset_endpoint(
+    background_tasks: BackgroundTasks,
+    credentials: HTTPBasicCredentials = Security(verify_credentials),
+) -> dict:
+    """
+    Reloads the csv file in the background, without restarting the workers of the API.
+    The new DataFrame, indexes and aggregates are built next to the ones in use and swapped in at once:
+    requests running meanwhile are answered from the version they started with.
+    The reload only rebuilds what changed, so reloading an unchanged file is cheap.
+
+    Return: status "reloading" and the version of the dataset in use until the reload ends.
+
+    Expected response format:
+    {
+     "status": "reloading",
+     "version": "string"
+    }
+
+    HTTP Response Codes:
+    - 202 Accepted: Reload started.
+    - 401 Unauthorized.
+    - 409 Conflict: A reload is already running, or an append: retry once it is done.
+    """
+    if _reload_lock.locked():
+        if _running == "append":
+            raise HTTPException(
+                status_code=409, detail="Append running, retry the reload"
+            )
+        raise HTTPException(status_code=409, detail="Reload already running")
+
+    background_tasks.add_task(run_in_pool, reload_dataset)
+    return {"status": "reloading", "version": dataset.version}
+
+
+# URL_22
+@app.post(
+    "/bookings/append/",
+    summary="Append bookings",
+    response_model=AppendResponse,
+    tags=["Service"],
+    status_code=201,
+)
+async def append_bookings_endpoint(
+    request: AppendRequest,
+    credentials: HTTPBasicCredentials = Security(verify_credentials),
+) -> dict:
+    """
+    Appends new bookings to the dataset: to the "bookings" table, in batched transactions,
+    to the csv file and to the DataFrame. The DataFrame, the country index and the aggregates are extended
+    with the new bookings only (the DataFrame is copied once, by the first append of a worker),
+    so appending 1000 bookings costs about the same whatever the size of the dataset.
+    Bookings other workers appended before are taken in first.
+    Requests running meanwhile are answered from the version they started with.
+
+    Return: the number of appended bookings and the new version of the dataset.
+
+    Expected response format:
+    {
+     "appended": 0,
+     "version": "string"
+    }
+
+    HTTP Response Codes:
+    - 201 Created: Bookings appended.
+    - 400 Bad Request: Invalid booking, e.g. an unknown month.
+    - 401 Unauthorized.
+    - 503 Service Unavailable: Other workers kept appending meanwhile, retry.
+    """
+    if not request.bookings:
+        return {"appended": 0, "version": dataset.version}
+
+    raw = pd.DataFrame(
+        [booking.model_dump(by_alias=True) for booking in request.bookings],
+        columns=SOURCE_COLUMNS,
+    )
+    try:
+        version = await run_in_pool(append_dataset, raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid booking: {e}")
+    except StaleDatasetError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"appended": len(raw), "version": version}
+
+
+# URL_23
+@app.get(
+    "/metrics",
+    summary="Metrics",
+    response_class=PlainTextResponse,
+    tags=["Service"],
+    status_code=200,
+)
+async def get_metrics() -> Response:
+    """
+    Returns the metrics of this worker in the Prometheus text format:
+    - http_requests_total: requests by route, method and status.
+    - http_requests_in_flight: requests being handled.
+    - http_request_duration_seconds: latency histogram by route.
+    - http_request_phase_seconds: time of the requests in sql (database queries),
+      compute (DataFrame work in the worker pool) and serialization (JSON encoding of the fast responses), by route.
+    - process_cpu_seconds_total, process_max_resident_memory_bytes, process_start_time_seconds.
+
+    Routes are labelled by their template, e.g. /bookings/{booking_id}.
+    Each worker process keeps its own metrics.
+
+    HTTP Response Codes:
+    - 200 OK: Metrics returned.
+    - 404 Not Found: Metrics are disabled (HOTEL_API_METRICS_ENABLED=false).
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Run the FastAPI application
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,237 @@
+import bisect
+import contextvars
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+# upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+# phase times of the current request, None outside of requests
+_request_phases = contextvars.ContextVar("request_phases", default=None)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values with fixed buckets, as Prometheus expects them.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        # yields (le, cumulative count), the last one for +Inf
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    Request metrics of this worker: count by route, method and status, requests in flight,
+    latency by route and the time spent in each phase by route.
+    Updates are a few additions under one lock, cheap enough to stay enabled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._in_flight = 0
+        self._latency = {}
+        self._phases = {}
+        self._started = time.time()
+
+    def start(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def finish(
+        self, route: str, method: str, status: int, seconds: float, phases: dict
+    ) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._latency.setdefault(route, Histogram()).observe(seconds)
+            for phase, phase_seconds in phases.items():
+                self._phases.setdefault((route, phase), Histogram()).observe(
+                    phase_seconds
+                )
+
+    def render(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            lines.append(
+                "# HELP http_requests_total Requests by route, method and status."
+            )
+            lines.append("# TYPE http_requests_total counter")
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}'
+                )
+
+            # the route of a request is only known once it is routed, after it started
+            lines.append("# HELP http_requests_in_flight Requests being handled.")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            lines.append(f"http_requests_in_flight {self._in_flight}")
+
+            lines.append(
+                "# HELP http_request_duration_seconds Request latency by route."
+            )
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for route, histogram in sorted(self._latency.items()):
+                _histogram_lines(
+                    lines,
+                    "http_request_duration_seconds",
+                    f'route="{route}"',
+                    histogram,
+                )
+
+            lines.append(
+                "# HELP http_request_phase_seconds Time of a request spent in sql, compute (worker pool) and serialization."
+            )
+            lines.append("# TYPE http_request_phase_seconds histogram")
+            for (route, phase), histogram in sorted(self._phases.items()):
+                _histogram_lines(
+                    lines,
+                    "http_request_phase_seconds",
+                    f'route="{route}",phase="{phase}"',
+                    histogram,
+                )
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        lines.append("# HELP process_cpu_seconds_total User and system CPU time.")
+        lines.append("# TYPE process_cpu_seconds_total counter")
+        lines.append(f"process_cpu_seconds_total {usage.ru_utime + usage.ru_stime}")
+        lines.append("# HELP process_max_resident_memory_bytes Peak resident memory.")
+        lines.append("# TYPE process_max_resident_memory_bytes gauge")
+        # ru_maxrss is in KiB on Linux
+        lines.append(f"process_max_resident_memory_bytes {usage.ru_maxrss * 1024}")
+        lines.append("# HELP process_start_time_seconds Start time, since the epoch.")
+        lines.append("# TYPE process_start_time_seconds gauge")
+        lines.append(f"process_start_time_seconds {self._started}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(lines: list, name: str, labels: str, histogram: Histogram):
+    for bound, count in histogram.samples():
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {sum(histogram.counts)}")
+
+
+def add_phase_time(phase: str, seconds: float) -> None:
+    """
+    Adds time spent in a phase to the current request, if any.
+    """
+    phases = _request_phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Measures the time of the block as a phase of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(name, time.perf_counter() - start)
+
+
+def instrument_engine(engine) -> None:
+    """
+    Adds the time of the statements executed by a (sync) engine to the sql phase of the current request.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        add_phase_time("sql", time.perf_counter() - conn.info["query_start"].pop())
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the metrics of every HTTP request.
+    Requests are labelled by route template (/bookings/{booking_id}), never by raw path,
+    so the number of series stays bounded; requests matching no route are labelled "unmatched".
+    """
+
+    def __init__(self, app, metrics: Metrics, routes):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    def _route(self, scope) -> str:
+        # set on the scope by the router: read once the app has returned
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        # answered before routing, e.g. from the response cache, or by no route
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        phases = {}
+        token = _request_phases.set(phases)
+        self.metrics.start()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_phases.reset(token)
+            self.metrics.finish(
+                self._route(scope),
+                scope["method"],
+                status,
+                time.perf_counter() - start,
+                phases,
+            )
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import date, datetime
+
+from fastapi import HTTPException
+
+
+# opaque cursor for keyset pagination: the sort order and the sort key of the last row of a page
+def encode_cursor(order: str, key: list) -> str:
+    payload = json.dumps({"order": order, "key": key}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def cursor_int(value) -> int:
+    # a bool is an int for Python, not for the cursor
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise TypeError(f"not an integer: {value!r}")
+    return value
+
+
+def cursor_date(value) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def decode_cursor(cursor: str, order: str, key_types: list) -> list:
+    """
+    Returns the sort key of the cursor, each value parsed by the function of key_types for its column:
+    cursor_int or cursor_date. Raises HTTPException 400 if the cursor is malformed,
+    belongs to another order, or its key does not fit the sort columns.
+    """
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        key = payload["key"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if payload.get("order") != order:
+        raise HTTPException(status_code=400, detail="Cursor belongs to another order")
+
+    if not isinstance(key, list) or len(key) != len(key_types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return [parse(value) for parse, value in zip(key_types, key)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
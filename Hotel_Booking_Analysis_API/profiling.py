@@ -0,0 +1,175 @@
+import asyncio
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# header carrying the profiling token: X-Profile-Token
+PROFILE_HEADER = "x-profile-token"
+
+# frames kept for each allocation of the memory snapshot
+TRACEMALLOC_FRAMES = 32
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class StackSampler(threading.Thread):
+    """
+    Sampling CPU profiler: every interval, records the stack of every thread of the process,
+    so the event loop and the worker pool are both seen, without slowing down the profiled code.
+    Stacks are counted in the folded format of flamegraph.pl and speedscope: thread;outer;...;inner count.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+def _write_folded(path: str, stacks) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in sorted(stacks.items()):
+            file.write(f"{stack} {count}\n")
+
+
+def _allocation_stacks(snapshot: tracemalloc.Snapshot) -> Counter:
+    # bytes still allocated at the end of the request, by allocation stack
+    stacks = Counter()
+    for statistic in snapshot.statistics("traceback"):
+        # oldest frame first, as in the folded format
+        stack = ";".join(
+            f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            for frame in statistic.traceback
+        )
+        stacks[stack] += statistic.size
+    return stacks
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling single requests on demand: those sending the X-Profile-Token header
+    with the token of the settings, and a random sample of the others.
+
+    A profiled request gets a CPU profile from a StackSampler and a tracemalloc snapshot of the memory
+    allocated during the request, written to the directory as:
+    - <id>.cpu.folded: sampled stacks, for flamegraph.pl or speedscope.
+    - <id>.memory.folded: bytes allocated by stack, for the same tools.
+    - <id>.tracemalloc: the snapshot, for tracemalloc.Snapshot.load.
+    The id is returned in the X-Profile-Id header of the response.
+
+    Only one request is profiled at a time: the sampler and tracemalloc see the whole process,
+    and requests running meanwhile show up in the profile too.
+    """
+
+    def __init__(
+        self,
+        app,
+        directory: str,
+        token: str = None,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+    ):
+        self.app = app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def _requested(self, scope) -> bool:
+        if self.token:
+            token = Headers(scope=scope).get(PROFILE_HEADER)
+            # compared as bytes: the header is decoded as latin-1, and compare_digest
+            # refuses strings with other than ASCII characters
+            if token is not None and hmac.compare_digest(
+                token.encode("latin-1"), self.token.encode()
+            ):
+                return True
+        return random.random() < self.sample_rate
+
+    def _profile_id(self, scope) -> str:
+        self._count += 1
+        path = scope["path"].strip("/").replace("/", "_") or "root"
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._count}-{path}"
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self._requested(scope)
+            or not self._lock.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = self._profile_id(scope)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["x-profile-id"] = profile_id
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # the snapshot and the files take a while: a thread of the default executor
+            # writes them, not the event loop, and releases the lock once they are written
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._finish, profile_id, sampler
+            )
+
+    def _finish(self, profile_id: str, sampler: StackSampler) -> None:
+        try:
+            stacks = sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._write(profile_id, stacks, snapshot)
+        finally:
+            self._lock.release()
+
+    def _write(self, profile_id: str, stacks, snapshot) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id)
+        # the allocations of the profiler itself are left out
+        snapshot = snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+        _write_folded(f"{path}.cpu.folded", stacks)
+        _write_folded(f"{path}.memory.folded", _allocation_stacks(snapshot))
+        snapshot.dump(f"{path}.tracemalloc")
@@ -1,5 +1,6 @@
 from enum import Enum
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # URL_1 create class for the expected response format and validate it:
@@ -11,6 +12,12 @@ class BookingAllResponse(BaseModel):
     guest_name: str
 
 
+# URL_1 sort orders supported by the keyset pagination
+class BookingOrder(str, Enum):
+    id = "id"
+    booking_date = "booking_date"
+
+
 # URL_2 create class for the expected response format and validate it:
 class BookingIdResponse(BaseModel):
     booking_date: str
@@ -42,6 +49,57 @@ class AnalysisResponse(BaseModel):
     result: dict
 
 
+# URL_6 create class for the expected response format and validate it
+class NationalityBooking(BaseModel):
+    hotel: str
+    is_canceled: int
+    lead_time: int
+    arrival_date_year: int
+    arrival_date_month: str
+    arrival_date_week_number: int
+    arrival_date_day_of_month: int
+    stays_in_weekend_nights: int
+    stays_in_week_nights: int
+    adults: int
+    children: Optional[float]
+    babies: int
+    meal: str
+    country: str
+    market_segment: str
+    distribution_channel: str
+    is_repeated_guest: int
+    previous_cancellations: int
+    previous_bookings_not_canceled: int
+    reserved_room_type: str
+    assigned_room_type: str
+    booking_changes: int
+    deposit_type: str
+    agent: Optional[float]
+    company: Optional[float]
+    days_in_waiting_list: int
+    customer_type: str
+    adr: float
+    required_car_parking_spaces: int
+    total_of_special_requests: int
+    reservation_status: str
+    reservation_status_date: str
+    name: str
+    email: Optional[str] = None
+    phone_number: Optional[str] = Field(None, alias="phone-number")
+    credit_card: Optional[str] = None
+
+    # the csv column is "phone-number": that is the key in the requests and the responses
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class NationalityResponse(BaseModel):
+    nationality: str
+    total: int
+    skip: int
+    limit: int
+    bookings: list[NationalityBooking]
+
+
 # URL_7 create class for the expected response format and validate it
 class PopularMealPackage(BaseModel):
     popular_meal_package: str
@@ -107,3 +165,52 @@ class CountByHotelRepeatedGuestResponse(BaseModel):
     hotel: str
     is_repeated_guest: int
     count: int
+
+
+# URL_18 formats and sources of the bulk export
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    arrow = "arrow"
+
+
+class ExportSource(str, Enum):
+    database = "database"
+    dataframe = "dataframe"
+
+
+# URL_19 create class for the expected response format and validate it
+class CacheStats(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+
+
+# URL_20 create class for the expected response format and validate it
+class AggregateResponse(BaseModel):
+    group_by: List[str]
+    filters: Dict[str, List[str]]
+    metrics: List[str]
+    order_by: List[str]
+    limit: Optional[int] = None
+    rows: List[Dict[str, Any]]
+
+
+# URL_21 create class for the expected response format and validate it
+class ReloadResponse(BaseModel):
+    status: str
+    version: str
+
+
+# URL_22 create class for the request and the response format and validate them:
+# new bookings have the columns of the csv file, as returned by URL_6
+class AppendRequest(BaseModel):
+    bookings: List[NationalityBooking]
+
+
+class AppendResponse(BaseModel):
+    appended: int
+    version: str
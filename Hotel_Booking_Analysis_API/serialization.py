@@ -0,0 +1,49 @@
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from config import settings
+from metrics import phase
+
+try:
+    import orjson
+except ImportError:  # without orjson the fast responses use pydantic-core
+    orjson = None
+
+# type adapters of the response models, compiled once
+_adapters = {}
+
+
+def _adapter(model) -> TypeAdapter:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter
+
+
+def encode_json(data, model) -> bytes:
+    """
+    Encodes data of the given response model straight to JSON bytes:
+    with orjson when it is installed, otherwise with the compiled pydantic-core validator and serializer.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    adapter = _adapter(model)
+    return adapter.dump_json(adapter.validate_python(data))
+
+
+def respond(data, model):
+    """
+    Returns the result of a route.
+
+    By default the data is returned as is, and FastAPI validates every item against the response_model
+    of the route and encodes it with the json module. With fast responses enabled (HOTEL_API_FAST_RESPONSES),
+    the data - already typed by the DataFrame or the database - is encoded to bytes at once.
+    The response_model of the route, and so the OpenAPI schema, stays the same.
+    """
+    if not settings.fast_responses:
+        return data
+    with phase("serialization"):
+        body = encode_json(data, model)
+    return Response(body, media_type="application/json")
@@ -0,0 +1,297 @@
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from aggregation import SCHEMA, PandasBackend, metric_name, normalize_query
+from dataset import DAY_NAMES
+
+
+class Aggregate(NamedTuple):
+    """
+    An aggregate of the dataset in two steps: the partial is a query of sums and counts
+    run on the analytics backend, finish turns it into the response. Partials of two sets of rows
+    add up to the partial of both, so appended rows update the aggregate without another pass over the dataset.
+    """
+
+    group_by: list
+    filters: list
+    metrics: list
+    finish: Callable
+
+    def partial(self, df: pd.DataFrame, backend=None) -> pd.DataFrame:
+        """
+        Returns the metrics of the query by group: a frame indexed by the group-by columns,
+        or of one row without them.
+        """
+        query = normalize_query(self.group_by, self.filters, self.metrics)
+        rows = (backend or PandasBackend()).aggregate(df, query)
+        names = [metric_name(metric) for metric in query["metrics"]]
+        partial = pd.DataFrame(rows, columns=query["group_by"] + names)
+        # a sum over no values is 0, as pandas computes it; DuckDB returns null.
+        # counts and sums of integers stay integers
+        measures = [metric.partition(":")[2] for metric in query["metrics"]]
+        partial = partial.fillna({name: 0 for name in names}).astype(
+            {
+                name: "float64" if SCHEMA.get(measure) == "float" else "int64"
+                for name, measure in zip(names, measures)
+            }
+        )
+        if query["group_by"]:
+            partial = partial.set_index(query["group_by"])
+        return partial
+
+    def __call__(self, df: pd.DataFrame, backend=None):
+        return self.finish(self.partial(df, backend))
+
+
+def _by_count(counts: pd.Series) -> pd.Series:
+    # most frequent first, ties in the order of the counts
+    return counts.sort_values(ascending=False, kind="stable")
+
+
+def merge_partials(left, right):
+    """
+    Adds two partials of an aggregate, keeping their types: counts stay integers.
+    """
+    merged = left.add(right, fill_value=0).sort_index()
+    if isinstance(left, pd.Series):
+        return merged.astype(np.result_type(left.dtype, right.dtype))
+    return merged.astype(
+        {
+            column: np.result_type(left[column].dtype, right[column].dtype)
+            for column in left.columns
+        }
+    )
+
+
+# URL_4
+def _stats(partial: pd.DataFrame) -> dict:
+    totals = partial.iloc[0]
+    return {
+        "total_bookigs": int(totals["count"]),
+        "average_length_of_stay": totals["sum_length_of_stay"] / totals["count"],
+        "average_daily_rate": totals["sum_adr"] / totals["count"],
+    }
+
+
+# URL_5
+def _booking_trends_by_month(partial: pd.DataFrame) -> dict:
+    return _by_count(partial["count"]).to_dict()
+
+
+def _guest_demographics(partial: pd.DataFrame) -> dict:
+    totals = partial.iloc[0]
+    return {
+        "total_adults": int(totals["sum_adults"]),
+        "total_children": int(totals["sum_children"]),
+        "total_babies": int(totals["sum_babies"]),
+    }
+
+
+def _popular_meal_packages(partial: pd.DataFrame) -> dict:
+    return _by_count(partial["count"]).to_dict()
+
+
+# URL_7
+def _popular_meal_package(partial: pd.DataFrame) -> dict:
+    return {"popular_meal_package": _by_count(partial["count"]).index[0]}
+
+
+# URL_8
+def _avg_length_of_stay(partial: pd.DataFrame) -> list:
+    return (
+        (partial["sum_length_of_stay"] / partial["count"])
+        .reset_index(name="average_stay")
+        .to_dict("records")
+    )
+
+
+# URL_9
+def _total_revenue(partial: pd.DataFrame) -> list:
+    return (
+        partial["sum_adr"]
+        .reset_index(name="total_revenue")
+        .rename(columns={"arrival_date_month": "month"})
+        .to_dict("records")
+    )
+
+
+# URL_10
+def _top_countries(partial: pd.DataFrame) -> list:
+    return (
+        _by_count(partial["count"])
+        .head()
+        .reset_index(name="number_of_bookings")
+        .to_dict("records")
+    )
+
+
+# URL_11
+def _repeated_guests_percentage(partial: pd.DataFrame) -> dict:
+    counts = partial["count"]
+    return {"percentage_repeated_guests": counts[1] / counts[0] * 100}
+
+
+# URL_12
+def _total_guests_by_year(partial: pd.DataFrame) -> list:
+    return (
+        partial.sum(axis=1)
+        .astype("int64")
+        .reset_index(name="total_guests")
+        .rename(columns={"arrival_date_year": "year"})
+        .to_dict("records")
+    )
+
+
+# URL_13
+def _avg_daily_rate_resort(partial: pd.DataFrame) -> list:
+    return (
+        (partial["sum_adr"] / partial["count"])
+        .reset_index(name="average_daily_rate")
+        .to_dict(orient="records")
+    )
+
+
+# URL_14
+def _most_common_arrival_day_city(partial: pd.DataFrame) -> dict:
+    # the most common day of the week of the arrival --> Wednesday, the first of the week on a tie
+    return {"most_common_day": partial["count"].reindex(DAY_NAMES).idxmax()}
+
+
+# URL_15
+def _count_by_hotel_meal(partial: pd.DataFrame) -> list:
+    return partial.reset_index().to_dict(orient="records")
+
+
+# URL_16
+def _total_revenue_resort_by_country(partial: pd.DataFrame) -> list:
+    return (
+        partial["sum_adr"].reset_index(name="total_revenue").to_dict(orient="records")
+    )
+
+
+# URL_17
+def _count_by_hotel_repeated_guest(partial: pd.DataFrame) -> list:
+    return partial.reset_index().to_dict(orient="records")
+
+
+GUESTS = ["sum:adults", "sum:children", "sum:babies"]
+RESORT = ["hotel:Resort Hotel"]
+
+# every aggregate served by the API, by name: group_by, filters and metrics of its partial
+AGGREGATES = {
+    "stats": Aggregate([], [], ["count", "sum:length_of_stay", "sum:adr"], _stats),
+    "booking_trends_by_month": Aggregate(
+        ["arrival_date_month"], [], ["count"], _booking_trends_by_month
+    ),
+    "guest_demographics": Aggregate([], [], GUESTS, _guest_demographics),
+    "popular_meal_packages": Aggregate(["meal"], [], ["count"], _popular_meal_packages),
+    "popular_meal_package": Aggregate(["meal"], [], ["count"], _popular_meal_package),
+    "avg_length_of_stay": Aggregate(
+        ["hotel", "arrival_date_year"],
+        [],
+        ["sum:length_of_stay", "count"],
+        _avg_length_of_stay,
+    ),
+    "total_revenue": Aggregate(
+        ["hotel", "arrival_date_month"], [], ["sum:adr"], _total_revenue
+    ),
+    "top_countries": Aggregate(["country"], [], ["count"], _top_countries),
+    "repeated_guests_percentage": Aggregate(
+        ["is_repeated_guest"], [], ["count"], _repeated_guests_percentage
+    ),
+    "total_guests_by_year": Aggregate(
+        ["arrival_date_year"], [], GUESTS, _total_guests_by_year
+    ),
+    "avg_daily_rate_resort": Aggregate(
+        ["arrival_date_month"], RESORT, ["sum:adr", "count"], _avg_daily_rate_resort
+    ),
+    "most_common_arrival_day_city": Aggregate(
+        ["day_of_week"], ["hotel:City Hotel"], ["count"], _most_common_arrival_day_city
+    ),
+    "count_by_hotel_meal": Aggregate(
+        ["hotel", "meal"], [], ["count"], _count_by_hotel_meal
+    ),
+    "total_revenue_resort_by_country": Aggregate(
+        ["country"], RESORT, ["sum:adr"], _total_revenue_resort_by_country
+    ),
+    "count_by_hotel_repeated_guest": Aggregate(
+        ["hotel", "is_repeated_guest"], [], ["count"], _count_by_hotel_repeated_guest
+    ),
+}
+
+
+class AnalyticsSnapshot:
+    """
+    Results of every aggregate in AGGREGATES, computed once for one version of the dataset,
+    with the partials they were finished from. The partials are computed on the given analytics backend,
+    pandas by default.
+    An aggregate that fails is stored as its exception and raised again on access,
+    so one broken aggregate does not take down the others.
+    """
+
+    def __init__(
+        self, df: pd.DataFrame, version: str, partials: dict = None, backend=None
+    ):
+        self.version = version
+        self._partials = {}
+        self._results = {}
+        for name, aggregate in AGGREGATES.items():
+            try:
+                if partials is None:
+                    partial = aggregate.partial(df, backend)
+                else:
+                    partial = partials[name]
+                self._partials[name] = partial
+                self._results[name] = aggregate.finish(partial)
+            except Exception as e:
+                self._results[name] = e
+
+    def extend(
+        self, df: pd.DataFrame, rows: pd.DataFrame, version: str, backend=None
+    ) -> "AnalyticsSnapshot":
+        """
+        Returns the snapshot of the dataset with the rows appended: the partials of the rows
+        are added to the stored ones, so the cost depends on the number of rows, not on the dataset.
+        df is the whole new dataset, used only for the aggregates that failed before.
+        """
+        partials = {}
+        for name, aggregate in AGGREGATES.items():
+            if name in self._partials:
+                partials[name] = merge_partials(
+                    self._partials[name], aggregate.partial(rows, backend)
+                )
+            else:
+                partials[name] = aggregate.partial(df, backend)
+        return AnalyticsSnapshot(df, version, partials)
+
+    def __getitem__(self, name: str):
+        result = self._results[name]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+# snapshot of the current dataset version
+_snapshots = {}
+
+
+def get_snapshot(
+    df: pd.DataFrame, version: str, cache=None, backend=None
+) -> AnalyticsSnapshot:
+    """
+    Returns the snapshot for the given dataset version, computing it only when the version changes.
+    With a shared cache, a snapshot computed by another worker is reused.
+    """
+    snapshot = _snapshots.get(version)
+    if snapshot is None:
+        cache_key = f"snapshot:{version}"
+        snapshot = cache.get_object(cache_key) if cache is not None else None
+        if snapshot is None:
+            snapshot = AnalyticsSnapshot(df, version, backend=backend)
+            if cache is not None:
+                cache.set_object(cache_key, snapshot)
+        _snapshots.clear()
+        _snapshots[version] = snapshot
+    return snapshot
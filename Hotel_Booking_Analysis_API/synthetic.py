@@ -0,0 +1,353 @@
+"""
+Synthetic bookings in the format of hotel_booking_data.csv, for benchmarks at any scale.
+
+Every column of the csv file is generated with the distribution of the original hotel booking
+demand data: about two thirds City Hotel, mostly BB meals and Portuguese guests, lead times and daily
+rates skewed to the right, a third of the bookings canceled. Arrival dates are real calendar dates
+from July 2015 to August 2017, and the reservation status date follows from the status:
+the check-out date, or a date before the arrival for cancellations.
+
+The rows only depend on the seed and their position, so a file of 10x the base size
+starts with the rows of the 1x file, and every run generates the same data.
+
+Usage:
+    python synthetic.py --scale 10 --output hotel_booking_data.csv
+    python synthetic.py --rows 5000 --seed 7 --output small.csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset import SOURCE_COLUMNS
+
+# rows of the original dataset, the 1x scale
+BASE_ROWS = 119_390
+
+# rows generated and written at once, to bound the memory at large scales
+CHUNK_ROWS = 250_000
+
+FIRST_DATE = pd.Timestamp("2015-07-01")
+LAST_DATE = pd.Timestamp("2017-08-31")
+
+# category: (values, probabilities)
+CATEGORIES = {
+    "hotel": (["City Hotel", "Resort Hotel"], [0.664, 0.336]),
+    "meal": (
+        ["BB", "HB", "SC", "Undefined", "FB"],
+        [0.773, 0.121, 0.089, 0.01, 0.007],
+    ),
+    "country": (
+        [
+            "PRT",
+            "GBR",
+            "FRA",
+            "ESP",
+            "DEU",
+            "ITA",
+            "IRL",
+            "BEL",
+            "BRA",
+            "NLD",
+            "USA",
+            "CHE",
+            "CN",
+            "AUT",
+            "SWE",
+            "CHN",
+            "POL",
+            "ISR",
+            "RUS",
+            "NOR",
+        ],
+        [
+            0.412,
+            0.103,
+            0.088,
+            0.072,
+            0.062,
+            0.032,
+            0.028,
+            0.02,
+            0.019,
+            0.018,
+            0.018,
+            0.015,
+            0.011,
+            0.011,
+            0.009,
+            0.009,
+            0.008,
+            0.006,
+            0.006,
+            0.053,
+        ],
+    ),
+    "market_segment": (
+        [
+            "Online TA",
+            "Offline TA/TO",
+            "Groups",
+            "Direct",
+            "Corporate",
+            "Complementary",
+            "Aviation",
+        ],
+        [0.473, 0.203, 0.166, 0.106, 0.044, 0.006, 0.002],
+    ),
+    "distribution_channel": (
+        ["TA/TO", "Direct", "Corporate", "GDS"],
+        [0.82, 0.123, 0.055, 0.002],
+    ),
+    "room_type": (
+        ["A", "D", "E", "F", "G", "B", "C", "H"],
+        [0.72, 0.161, 0.055, 0.024, 0.018, 0.01, 0.007, 0.005],
+    ),
+    "deposit_type": (
+        ["No Deposit", "Non Refund", "Refundable"],
+        [0.876, 0.122, 0.002],
+    ),
+    "customer_type": (
+        ["Transient", "Transient-Party", "Contract", "Group"],
+        [0.75, 0.211, 0.034, 0.005],
+    ),
+}
+
+FIRST_NAMES = [
+    "Jamie",
+    "Anna",
+    "Michael",
+    "Laura",
+    "David",
+    "Maria",
+    "John",
+    "Sofia",
+    "Robert",
+    "Emma",
+    "Daniel",
+    "Olivia",
+    "James",
+    "Ana",
+    "Thomas",
+    "Julia",
+]
+LAST_NAMES = [
+    "Smith",
+    "Brown",
+    "Johnson",
+    "Silva",
+    "Garcia",
+    "Martin",
+    "Williams",
+    "Santos",
+    "Jones",
+    "Miller",
+    "Davis",
+    "Ferreira",
+    "Wilson",
+    "Moore",
+    "Taylor",
+    "Costa",
+]
+
+
+class _Streams:
+    """
+    Random generator of a chunk whose every draw comes from a stream of its own,
+    spawned in the order of the draws: the first n values of a draw are the same
+    whatever its size, so a chunk of n rows is the start of the full chunk.
+    """
+
+    def __init__(self, seed: int, chunk: int):
+        self._sequence = np.random.SeedSequence([seed, chunk])
+
+    def __getattr__(self, name: str):
+        (child,) = self._sequence.spawn(1)
+        return getattr(np.random.default_rng(child), name)
+
+
+def _choice(rng: _Streams, category: str, size: int) -> np.ndarray:
+    values, probabilities = CATEGORIES[category]
+    probabilities = np.array(probabilities) / sum(probabilities)
+    return np.array(values, dtype=object)[
+        rng.choice(len(values), size=size, p=probabilities)
+    ]
+
+
+def generate_bookings(rows: int, seed: int = 0, start: int = 0) -> pd.DataFrame:
+    """
+    Returns rows synthetic bookings with the columns of the csv file, in their order.
+    start is the position of the first row: generate_bookings(n, seed, start) is the same
+    as rows start to start + n of a larger file with that seed.
+    """
+    if rows == 0:
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
+
+    # random streams per chunk, seeded by the seed and the chunk,
+    # so the rows do not depend on how the file is split; a chunk is generated
+    # up to the last row needed only
+    frames = []
+    end = start + rows
+    for chunk in range(start // CHUNK_ROWS, (end - 1) // CHUNK_ROWS + 1):
+        first = max(start - chunk * CHUNK_ROWS, 0)
+        last = min(end - chunk * CHUNK_ROWS, CHUNK_ROWS)
+        frames.append(_generate_chunk(seed, chunk, last).iloc[first:])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _generate_chunk(seed: int, chunk: int, size: int) -> pd.DataFrame:
+    # the first size rows of the chunk
+    rng = _Streams(seed, chunk)
+
+    hotel = _choice(rng, "hotel", size)
+    resort = hotel == "Resort Hotel"
+    is_canceled = (rng.random(size) < np.where(resort, 0.28, 0.42)).astype("int64")
+
+    days = (LAST_DATE - FIRST_DATE).days + 1
+    arrival = FIRST_DATE + pd.to_timedelta(rng.integers(0, days, size), unit="D")
+    lead_time = np.minimum(rng.exponential(104, size).astype("int64"), 737)
+
+    weekend_nights = rng.poisson(np.where(resort, 1.2, 0.8), size)
+    week_nights = rng.poisson(np.where(resort, 3.1, 2.2), size)
+    nights = weekend_nights + week_nights
+
+    adults = rng.choice([1, 2, 3, 0], size=size, p=[0.19, 0.75, 0.053, 0.007])
+    children = rng.choice(
+        [0.0, 1.0, 2.0, 3.0], size=size, p=[0.928, 0.04, 0.031, 0.001]
+    )
+    # a few bookings have no children count, as in the original data
+    children[rng.random(size) < 0.00004] = np.nan
+    babies = rng.choice([0, 1, 2], size=size, p=[0.992, 0.0075, 0.0005])
+
+    # daily rates: higher in the summer for the resort, lognormal around 100
+    summer = np.isin(arrival.month, [7, 8])
+    adr = rng.lognormal(np.log(90), 0.45, size) * np.where(resort & summer, 1.6, 1.0)
+    adr = np.round(adr, 2)
+
+    is_repeated_guest = (rng.random(size) < 0.032).astype("int64")
+    previous_cancellations = np.where(
+        rng.random(size) < 0.054, rng.integers(1, 4, size), 0
+    )
+    previous_bookings = np.where(is_repeated_guest == 1, rng.integers(1, 10, size), 0)
+
+    room_type = _choice(rng, "room_type", size)
+    # most bookings get the room type they reserved
+    assigned_room_type = np.where(
+        rng.random(size) < 0.875, room_type, _choice(rng, "room_type", size)
+    )
+
+    agent = np.where(rng.random(size) < 0.137, np.nan, rng.integers(1, 536, size))
+    company = np.where(rng.random(size) < 0.943, np.nan, rng.integers(6, 544, size))
+
+    canceled = is_canceled == 1
+    no_show = canceled & (rng.random(size) < 0.03)
+    reservation_status = np.where(
+        no_show, "No-Show", np.where(canceled, "Canceled", "Check-Out")
+    )
+    # check-out after the stay, cancellations between the booking and the arrival
+    before_arrival = pd.to_timedelta(
+        (rng.random(size) * lead_time).astype("int64"), unit="D"
+    )
+    status_date = np.where(
+        canceled,
+        arrival - before_arrival,
+        arrival + pd.to_timedelta(nights, unit="D"),
+    )
+
+    first_name = rng.choice(FIRST_NAMES, size)
+    last_name = rng.choice(LAST_NAMES, size)
+    name = pd.Series(first_name, dtype=object) + " " + last_name
+
+    frame = pd.DataFrame(
+        {
+            "hotel": hotel,
+            "is_canceled": is_canceled,
+            "lead_time": lead_time,
+            "arrival_date_year": arrival.year,
+            "arrival_date_month": arrival.month_name(),
+            "arrival_date_week_number": arrival.isocalendar().week.to_numpy(),
+            "arrival_date_day_of_month": arrival.day,
+            "stays_in_weekend_nights": weekend_nights,
+            "stays_in_week_nights": week_nights,
+            "adults": adults,
+            "children": children,
+            "babies": babies,
+            "meal": _choice(rng, "meal", size),
+            "country": _choice(rng, "country", size),
+            "market_segment": _choice(rng, "market_segment", size),
+            "distribution_channel": _choice(rng, "distribution_channel", size),
+            "is_repeated_guest": is_repeated_guest,
+            "previous_cancellations": previous_cancellations,
+            "previous_bookings_not_canceled": previous_bookings,
+            "reserved_room_type": room_type,
+            "assigned_room_type": assigned_room_type,
+            "booking_changes": rng.poisson(0.22, size),
+            "deposit_type": _choice(rng, "deposit_type", size),
+            "agent": agent,
+            "company": company,
+            "days_in_waiting_list": np.where(
+                rng.random(size) < 0.03, rng.integers(1, 200, size), 0
+            ),
+            "customer_type": _choice(rng, "customer_type", size),
+            "adr": adr,
+            "required_car_parking_spaces": (rng.random(size) < 0.062).astype("int64"),
+            "total_of_special_requests": rng.choice(
+                [0, 1, 2, 3, 4, 5],
+                size=size,
+                p=[0.589, 0.278, 0.109, 0.021, 0.0025, 0.0005],
+            ),
+            "reservation_status": reservation_status,
+            "reservation_status_date": pd.DatetimeIndex(status_date).strftime(
+                "%Y-%m-%d"
+            ),
+            "name": name,
+            "email": name.str.replace(" ", ".").str.lower() + "@example.com",
+            "phone-number": [
+                f"{a:03}-{b:03}-{c:04}"
+                for a, b, c in zip(
+                    rng.integers(200, 999, size),
+                    rng.integers(0, 999, size),
+                    rng.integers(0, 9999, size),
+                )
+            ],
+            "credit_card": [
+                f"************{digits:04}" for digits in rng.integers(0, 9999, size)
+            ],
+        }
+    )
+    return frame
+
+
+def write_csv(path: str, rows: int, seed: int = 0) -> None:
+    """
+    Writes rows synthetic bookings to a csv file, chunk by chunk.
+    """
+    partial_path = f"{path}.partial"
+    with open(partial_path, "w", encoding="utf-8", newline="") as file:
+        # the header, also for an empty file
+        generate_bookings(0).to_csv(file, index=False)
+        for start in range(0, rows, CHUNK_ROWS):
+            frame = generate_bookings(min(CHUNK_ROWS, rows - start), seed, start)
+            frame.to_csv(file, header=False, index=False)
+    # the file appears complete or not at all
+    os.replace(partial_path, path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="hotel_booking_data.csv")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--scale", type=float, default=1, help=f"times {BASE_ROWS} rows")
+    size.add_argument("--rows", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = args.rows if args.rows is not None else int(BASE_ROWS * args.scale)
+    write_csv(args.output, rows, args.seed)
+    print(f"{rows} bookings written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main loads the dataset of the settings when imported: the tests run on a small synthetic one,
+# with its own database and caches, in a directory removed at the end of the session
+DIRECTORY = tempfile.mkdtemp(prefix="hotel-api-tests-")
+DATASET_PATH = os.path.join(DIRECTORY, "hotel_booking_data.csv")
+DATABASE_PATH = os.path.join(DIRECTORY, "hotel.db")
+os.environ.update(
+    {
+        "HOTEL_API_DATASET_PATH": DATASET_PATH,
+        "HOTEL_API_DATASET_CACHE_PATH": os.path.join(DIRECTORY, "hotel.arrow"),
+        "HOTEL_API_DATABASE_URL": f"sqlite:///{DATABASE_PATH}",
+        "HOTEL_API_ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{DATABASE_PATH}",
+        "HOTEL_API_CACHE_PATH": os.path.join(DIRECTORY, "hotel_cache.db"),
+    }
+)
+
+from synthetic import write_csv  # noqa: E402
+
+write_csv(DATASET_PATH, 5000, seed=0)
+
+CREDENTIALS = ("Anton", "pass123456")
+
+
+def same(left, right) -> bool:
+    # the same values in the same order; sums added up in another order may differ in the last digits
+    if isinstance(left, float) or isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9)
+    if isinstance(left, dict):
+        return list(left) == list(right) and all(
+            same(left[key], right[key]) for key in left
+        )
+    if isinstance(left, list):
+        return len(left) == len(right) and all(map(same, left, right))
+    return left == right
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
+    shutil.rmtree(DIRECTORY, ignore_errors=True)
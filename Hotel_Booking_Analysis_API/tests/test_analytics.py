@@ -0,0 +1,135 @@
+import math
+
+import pytest
+
+import aggregation
+from conftest import CREDENTIALS, same
+from snapshot import AGGREGATES, AnalyticsSnapshot
+
+# analytics endpoints with the /bookings/aggregate/ query computing the same numbers:
+# (aggregate, group_by, filters, metrics, order_by, limit,
+#  columns of the endpoint for group_by and for the metrics, added up)
+ENDPOINT_QUERIES = [
+    (
+        "total_revenue",
+        ["hotel", "arrival_date_month"],
+        [],
+        ["sum:adr"],
+        [],
+        None,
+        ["hotel", "month"],
+        "total_revenue",
+    ),
+    (
+        "count_by_hotel_meal",
+        ["hotel", "meal"],
+        [],
+        ["count"],
+        [],
+        None,
+        ["hotel", "meal"],
+        "count",
+    ),
+    (
+        "total_revenue_resort_by_country",
+        ["country"],
+        ["hotel:Resort Hotel"],
+        ["sum:adr"],
+        [],
+        None,
+        ["country"],
+        "total_revenue",
+    ),
+    (
+        "avg_daily_rate_resort",
+        ["arrival_date_month"],
+        ["hotel:Resort Hotel"],
+        ["mean:adr"],
+        [],
+        None,
+        ["arrival_date_month"],
+        "average_daily_rate",
+    ),
+    (
+        "count_by_hotel_repeated_guest",
+        ["hotel", "is_repeated_guest"],
+        [],
+        ["count"],
+        [],
+        None,
+        ["hotel", "is_repeated_guest"],
+        "count",
+    ),
+    (
+        "total_guests_by_year",
+        ["arrival_date_year"],
+        [],
+        ["sum:adults", "sum:children", "sum:babies"],
+        [],
+        None,
+        ["year"],
+        "total_guests",
+    ),
+    (
+        "top_countries",
+        ["country"],
+        [],
+        ["count"],
+        ["-count"],
+        5,
+        ["country"],
+        "number_of_bookings",
+    ),
+]
+
+
+def _backends():
+    yield aggregation.PandasBackend()
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return
+    yield aggregation.DuckDBBackend(threads=1)
+
+
+@pytest.mark.parametrize("backend", list(_backends()), ids=lambda b: type(b).__name__)
+@pytest.mark.parametrize(
+    "name, group_by, filters, metrics, order_by, limit, columns, value",
+    ENDPOINT_QUERIES,
+    ids=[query[0] for query in ENDPOINT_QUERIES],
+)
+def test_backend_matches_endpoint(
+    client, backend, name, group_by, filters, metrics, order_by, limit, columns, value
+):
+    import main
+
+    current = main.dataset
+    query = aggregation.normalize_query(group_by, filters, metrics, order_by, limit)
+    rows = backend.aggregate(current.df, query)
+
+    # the same groups, in the same order, with the same numbers as the endpoint
+    response = client.get(f"/bookings/{name}/", auth=CREDENTIALS)
+    assert response.status_code == 200
+    expected = [
+        (tuple(row[column] for column in columns), row[value])
+        for row in response.json()
+    ]
+    names = [aggregation.metric_name(metric) for metric in metrics]
+    actual = [
+        (tuple(row[column] for column in group_by), sum(row[name] for name in names))
+        for row in rows
+    ]
+    assert [groups for groups, _ in actual] == [groups for groups, _ in expected]
+    for (groups, number), (_, expected_number) in zip(actual, expected):
+        assert math.isclose(number, expected_number, rel_tol=1e-9), groups
+
+
+@pytest.mark.parametrize("backend", list(_backends()), ids=lambda b: type(b).__name__)
+def test_snapshot_on_backend(client, backend):
+    import main
+
+    # the analytics endpoints answer the same on every backend
+    current = main.dataset
+    snapshot = AnalyticsSnapshot(current.df, current.version, backend=backend)
+    for name in AGGREGATES:
+        assert same(snapshot[name], current.snapshot[name]), name
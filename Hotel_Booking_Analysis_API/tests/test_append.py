@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import dataset as dataset_module
+from conftest import CREDENTIALS, DATASET_PATH, same
+from database import append_bookings, stored_version
+from dataset import SOURCE_COLUMNS, build_country_index, read_csv
+from snapshot import AGGREGATES, AnalyticsSnapshot
+from synthetic import generate_bookings
+
+
+def _assert_as_after_restart(bundle):
+    # the same frame, country index and aggregates as a fresh load of the file
+    fresh = read_csv(DATASET_PATH)
+    assert_frame_equal(bundle.df, fresh)
+    index = build_country_index(fresh)
+    assert set(bundle.country_index) == set(index)
+    for country, positions in index.items():
+        assert (bundle.country_index[country] == positions).all(), country
+    recomputed = AnalyticsSnapshot(fresh, bundle.version)
+    for name in AGGREGATES:
+        assert same(bundle.snapshot[name], recomputed[name]), name
+
+
+def _new_rows(rows: int = 20, seed: int = 1) -> pd.DataFrame:
+    # new categories sorting before and after the existing ones
+    raw = generate_bookings(rows, seed=seed)[SOURCE_COLUMNS]
+    raw.loc[:9, "country"] = "AAA"
+    raw.loc[10:, "country"] = "ZZZ"
+    raw.loc[:4, "meal"] = "AA"
+    return raw
+
+
+def test_appends_of_another_worker(client, monkeypatch):
+    import main
+
+    before = main.dataset
+    # appended by another worker: the table and the file change, not the bundle of this one
+    version = append_bookings(DATASET_PATH, _new_rows(), before.version)
+    assert stored_version() == version != before.version
+
+    def no_reload(path):
+        raise AssertionError("the csv file was parsed again")
+
+    monkeypatch.setattr(dataset_module, "read_csv", no_reload)
+    assert main.reload_dataset()
+    monkeypatch.undo()
+
+    current = main.dataset
+    assert current.version == version
+    assert len(current.df) == len(before.df) + 20
+
+    _assert_as_after_restart(current)
+
+    response = client.get("/bookings/nationality/", params={"nationality": "ZZZ"})
+    assert response.json()["total"] == 10
+
+
+def test_reload_of_current_version(client):
+    import main
+
+    current = main.dataset
+    assert main.reload_dataset()
+    assert main.dataset is current
+
+
+def test_reload_during_append(client, monkeypatch):
+    import main
+
+    # the request tells a running append from a running reload
+    for running, detail in [
+        ("append", "Append running, retry the reload"),
+        ("reload", "Reload already running"),
+    ]:
+        monkeypatch.setattr(main, "_running", running)
+        with main._reload_lock:
+            response = client.post("/dataset/reload/", auth=CREDENTIALS)
+        assert response.status_code == 409
+        assert response.json()["detail"] == detail
+
+
+def test_append_after_another_worker(client):
+    import main
+
+    before = main.dataset
+    # another worker appends first, this one appends before its next sync
+    append_bookings(DATASET_PATH, _new_rows(10, seed=2), before.version)
+    version = main.append_dataset(_new_rows(5, seed=3))
+
+    current = main.dataset
+    assert stored_version() == version == current.version
+    assert len(current.df) == len(before.df) + 15
+    _assert_as_after_restart(current)
+
+
+def test_appends_extend_in_place(client):
+    import main
+
+    main.append_dataset(_new_rows(5, seed=4))
+    first = main.dataset
+    main.append_dataset(_new_rows(5, seed=5))
+    second = main.dataset
+
+    # the second append writes after the rows of the first one, without copying them
+    for name in ("adr", "lead_time", "name"):
+        assert np.shares_memory(first.df[name].to_numpy(), second.df[name].to_numpy())
+    assert len(first.df) + 5 == len(second.df)
+    _assert_as_after_restart(second)
@@ -0,0 +1,27 @@
+import pytest
+
+from conftest import CREDENTIALS
+
+# /bookings/aggregate/ answers the same questions as the protected analytics routes
+PROTECTED = [
+    ("/bookings/count_by_hotel_meal/", {}),
+    (
+        "/bookings/aggregate/",
+        {"group_by": ["hotel", "meal"]},
+    ),
+    (
+        "/bookings/aggregate/",
+        {"group_by": "country", "filter": "hotel:Resort Hotel", "metric": "sum:adr"},
+    ),
+    (
+        "/bookings/aggregate/",
+        {"group_by": ["hotel", "is_repeated_guest"]},
+    ),
+]
+
+
+@pytest.mark.parametrize("path, params", PROTECTED)
+def test_requires_credentials(client, path, params):
+    assert client.get(path, params=params).status_code == 401
+    assert client.get(path, params=params, auth=("Anton", "wrong")).status_code == 401
+    assert client.get(path, params=params, auth=CREDENTIALS).status_code == 200
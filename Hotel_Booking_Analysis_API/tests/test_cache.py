@@ -0,0 +1,116 @@
+import pytest
+
+import cache as cache_module
+from cache import CacheBackend, MemoryCache, SQLiteCache
+from conftest import CREDENTIALS
+
+
+class Clock:
+    # time.time of the cache module, moved forward by the tests
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path, clock):
+    def make(**limits):
+        if request.param == "memory":
+            return MemoryCache(**limits)
+        return SQLiteCache(str(tmp_path / "cache.db"), **limits)
+
+    return make
+
+
+def _keys(cache, keys) -> list:
+    return [key for key in keys if cache.get(key) is not None]
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_lru_evicts_least_recently_used(make_cache, clock):
+    cache = make_cache(max_entries=2, eviction="lru")
+    cache.set("a", b"1")
+    clock.now += 1
+    cache.set("b", b"2")
+    clock.now += 1
+    assert cache.get("a") == b"1"
+    clock.now += 1
+    cache.set("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_fifo_evicts_oldest(make_cache, clock):
+    cache = make_cache(max_entries=2, eviction="fifo")
+    cache.set("a", b"1")
+    clock.now += 1
+    cache.set("b", b"2")
+    clock.now += 1
+    assert cache.get("a") == b"1"
+    clock.now += 1
+    cache.set("c", b"3")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == b"2"
+    assert cache.get("c") == b"3"
+
+
+def test_max_bytes(make_cache, clock):
+    cache = make_cache(max_bytes=10)
+    for key in "abc":
+        cache.set(key, b"x" * 4)
+        clock.now += 1
+
+    assert _keys(cache, "abc") == ["b", "c"]
+    assert cache.stats()["bytes"] == 8
+
+
+def test_ttl_expiry(make_cache, clock):
+    cache = make_cache(ttl=10)
+    cache.set("default", b"1")
+    cache.set("short", b"2", ttl=1)
+    cache.set("long", b"3", ttl=100)
+
+    clock.now += 5
+    assert _keys(cache, ["default", "short", "long"]) == ["default", "long"]
+    clock.now += 10
+    assert _keys(cache, ["default", "short", "long"]) == ["long"]
+
+
+def test_hits_and_misses(make_cache):
+    cache = make_cache()
+    assert cache.get("a") is None
+    cache.set_object("a", {"rows": [1, 2]})
+    assert cache.get_object("a") == {"rows": [1, 2]}
+    assert cache.get_object("a") == {"rows": [1, 2]}
+    cache.delete("a")
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 0)
+
+
+def test_stats_endpoint(client):
+    import main
+
+    before = client.get("/cache/stats/", auth=CREDENTIALS).json()
+    assert before["backend"] == type(main.cache).__name__
+    main.cache.get("missing key")
+    after = client.get("/cache/stats/", auth=CREDENTIALS).json()
+    assert after["misses"] == before["misses"] + 1
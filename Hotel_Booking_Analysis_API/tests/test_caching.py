@@ -0,0 +1,42 @@
+from typing import List
+
+from fastapi import FastAPI, Query
+from fastapi.testclient import TestClient
+
+from cache import MemoryCache
+from caching import ResponseCacheMiddleware
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+
+    @app.get("/columns/")
+    async def columns(column: List[str] = Query(None), limit: int = Query(None)):
+        return {"columns": column, "limit": limit}
+
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        paths=["/columns/"],
+        version=lambda: "1",
+        cache=MemoryCache(),
+    )
+    return TestClient(app)
+
+
+def test_repeated_parameters_keep_their_order():
+    with _client() as client:
+        first = client.get("/columns/?column=b&column=a")
+        second = client.get("/columns/?column=a&column=b")
+
+    assert first.json()["columns"] == ["b", "a"]
+    assert second.json()["columns"] == ["a", "b"]
+    assert first.headers["etag"] != second.headers["etag"]
+
+
+def test_parameter_order_shares_the_response():
+    with _client() as client:
+        first = client.get("/columns/?column=a&limit=5")
+        second = client.get("/columns/?limit=5&column=a")
+
+    assert first.json() == second.json()
+    assert first.headers["etag"] == second.headers["etag"]
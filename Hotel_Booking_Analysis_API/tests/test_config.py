@@ -0,0 +1,18 @@
+from config import Settings
+
+
+def test_empty_variables_are_none(monkeypatch):
+    for name in ("DATASET_SYNC_INTERVAL", "DATASET_WATCH_INTERVAL", "CACHE_TTL"):
+        monkeypatch.setenv(f"HOTEL_API_{name}", "")
+    settings = Settings()
+    assert settings.dataset_sync_interval is None
+    assert settings.dataset_watch_interval is None
+    assert settings.cache_ttl is None
+
+
+def test_intervals_from_variables(monkeypatch):
+    monkeypatch.setenv("HOTEL_API_DATASET_SYNC_INTERVAL", "0")
+    monkeypatch.setenv("HOTEL_API_DATASET_WATCH_INTERVAL", "2.5")
+    settings = Settings()
+    assert settings.dataset_sync_interval == 0
+    assert settings.dataset_watch_interval == 2.5
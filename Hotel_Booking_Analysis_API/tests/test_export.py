@@ -0,0 +1,85 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+SOURCES = ["database", "dataframe"]
+
+
+@pytest.mark.parametrize("source", SOURCES)
+@pytest.mark.parametrize("parameter", ["booking_date", "date_from", "date_to"])
+def test_malformed_date(client, source, parameter):
+    response = client.get(
+        "/bookings/export/", params={"source": source, parameter: "2016-02-30"}
+    )
+    assert response.status_code == 400
+    assert parameter in response.json()["detail"]
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_empty_arrow_stream(client, source):
+    response = client.get(
+        "/bookings/export/",
+        params={"source": source, "format": "arrow", "guest_name": "Nobody Here"},
+    )
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 0
+    assert len(table.schema) > 0
+
+
+def test_empty_arrow_schema_matches(client):
+    # the schema of an empty export is the one of a non-empty one
+    params = {"source": "database", "format": "arrow"}
+    empty = client.get("/bookings/export/", params={**params, "guest_name": "Nobody"})
+    full = client.get("/bookings/export/", params={**params, "min_stay": 3})
+    assert (
+        pa.ipc.open_stream(empty.content)
+        .schema.remove_metadata()
+        .equals(pa.ipc.open_stream(full.content).schema.remove_metadata())
+    )
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"date_from": "2016-01-01", "date_to": "2016-01-31"},
+        {"min_stay": 5, "max_stay": 6, "min_rate": 100},
+        {"length_of_stay": [1, 2], "guest_name": ["Jamie Smith", "Anna Brown"]},
+        {"booking_date": ["2016-03-05", "2017-03-05"]},
+    ],
+)
+def test_filters_match_search(client, params):
+    search = client.get("/bookings/search/", params={**params, "limit": 1000})
+    expected = len(search.json()) if search.status_code == 200 else 0
+    assert expected < 1000
+
+    for source in SOURCES:
+        response = client.get(
+            "/bookings/export/", params={**params, "source": source, "format": "csv"}
+        )
+        assert response.status_code == 200
+        assert len(pd.read_csv(io.BytesIO(response.content))) == expected
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_empty_csv_has_header(client, source):
+    # an empty export has the header of a non-empty one
+    params = {"source": source, "format": "csv"}
+    empty = client.get("/bookings/export/", params={**params, "guest_name": "Nobody"})
+    full = client.get("/bookings/export/", params={**params, "min_stay": 3})
+    assert empty.status_code == 200
+    header = pd.read_csv(io.BytesIO(empty.content))
+    assert header.empty
+    assert list(header.columns) == list(pd.read_csv(io.BytesIO(full.content)).columns)
+
+
+def test_unknown_nationality(client):
+    params = {"source": "dataframe", "nationality": "XYZ"}
+    response = client.get("/bookings/export/", params=params)
+    assert response.status_code == 404
+    assert (
+        response.json()
+        == client.get("/bookings/nationality/", params={"nationality": "XYZ"}).json()
+    )
@@ -0,0 +1,43 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Metrics, MetricsMiddleware
+
+
+class Routes(list):
+    # routes of the middleware, recording the requests it matched against them
+    def __init__(self, routes):
+        super().__init__(routes)
+        self.matched = 0
+
+    def __iter__(self):
+        self.matched += 1
+        return super().__iter__()
+
+
+def test_routes_read_after_routing():
+    app = FastAPI()
+
+    @app.get("/bookings/{booking_id}")
+    async def booking(booking_id: int):
+        return booking_id
+
+    metrics = Metrics()
+    routes = Routes(app.router.routes)
+    app.add_middleware(MetricsMiddleware, metrics=metrics, routes=routes)
+
+    with TestClient(app) as client:
+        assert client.get("/bookings/1").status_code == 200
+        assert client.get("/bookings/2").status_code == 200
+        assert client.get("/nowhere").status_code == 404
+
+    # the routed requests are labelled from the route the router set,
+    # only the request no route answered is matched again
+    assert routes.matched == 1
+    text = metrics.render()
+    assert (
+        'http_requests_total{route="/bookings/{booking_id}",method="GET",status="200"} 2'
+        in text
+    )
+    assert 'http_requests_total{route="unmatched",method="GET",status="404"} 1' in text
+    assert "http_requests_in_flight 0" in text
@@ -0,0 +1,18 @@
+import pandas as pd
+
+from conftest import DATASET_PATH
+
+
+def test_every_column_of_the_csv_file(client):
+    response = client.get(
+        "/bookings/nationality/", params={"nationality": "PRT", "limit": 5}
+    )
+    assert response.status_code == 200
+    bookings = response.json()["bookings"]
+
+    csv = pd.read_csv(DATASET_PATH)
+    expected = csv[csv.country == "PRT"].head(5)
+    assert list(bookings[0]) == list(csv.columns)
+    for booking, (_, row) in zip(bookings, expected.iterrows()):
+        for column in ("name", "email", "phone-number", "credit_card"):
+            assert booking[column] == row[column]
@@ -0,0 +1,44 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+def test_cursor_continues_the_pages(client):
+    first = client.get("/bookings", params={"limit": 10, "order_by": "booking_date"})
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(
+        "/bookings",
+        params={"limit": 10, "order_by": "booking_date", "cursor": cursor},
+    )
+    assert second.status_code == 200
+    pages = first.json() + second.json()
+    keys = [(booking["booking_date"], booking["id"]) for booking in pages]
+    assert keys == sorted(keys) and len(set(keys)) == 20
+
+
+@pytest.mark.parametrize(
+    "order, key",
+    [
+        ("id", 5),
+        ("id", ["x"]),
+        ("id", [True]),
+        ("id", [1.5]),
+        ("id", []),
+        ("id", [1, 2]),
+        ("booking_date", [5, 1]),
+        ("booking_date", ["2016-02-30", 1]),
+        ("booking_date", ["2016-01-01"]),
+        ("booking_date", ["2016-01-01", "1"]),
+    ],
+)
+def test_invalid_cursor_key(client, order, key):
+    cursor = encode_cursor(order, key)
+    response = client.get("/bookings", params={"order_by": order, "cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "WzFd", "eyJvcmRlciI6ImlkIn0"])
+def test_malformed_cursor(client, cursor):
+    response = client.get("/bookings", params={"cursor": cursor})
+    assert response.status_code == 400
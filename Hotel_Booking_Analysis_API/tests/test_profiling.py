@@ -0,0 +1,55 @@
+import os
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from profiling import PROFILE_HEADER, ProfilingMiddleware
+
+
+def test_profile_written_off_the_event_loop(tmp_path, monkeypatch):
+    threads = {}
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        threads["loop"] = threading.get_ident()
+        return sorted(range(100_000), reverse=True)[:3]
+
+    write = ProfilingMiddleware._write
+
+    def recording_write(self, *args):
+        threads["write"] = threading.get_ident()
+        write(self, *args)
+
+    monkeypatch.setattr(ProfilingMiddleware, "_write", recording_write)
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), token="s3cret")
+
+    with TestClient(app) as client:
+        response = client.get("/work", headers={PROFILE_HEADER: "s3cret"})
+        unprofiled = client.get("/work", headers={PROFILE_HEADER: "wrong"})
+
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    assert "x-profile-id" not in unprofiled.headers
+    assert threads["write"] != threads["loop"]
+    for suffix in (".cpu.folded", ".memory.folded", ".tracemalloc"):
+        assert os.path.exists(tmp_path / f"{profile_id}{suffix}")
+
+
+def test_token_with_non_ascii_characters(tmp_path):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        return "done"
+
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), token="s3crét")
+
+    with TestClient(app) as client:
+        wrong = client.get("/work", headers={PROFILE_HEADER: "wröng".encode()})
+        right = client.get("/work", headers={PROFILE_HEADER: "s3crét".encode()})
+
+    assert wrong.status_code == 200
+    assert "x-profile-id" not in wrong.headers
+    assert "x-profile-id" in right.headers
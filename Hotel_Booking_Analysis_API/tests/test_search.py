@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "parameter, value",
+    [
+        ("booking_date", "2016-13-01"),
+        ("booking_date", "yesterday"),
+        ("date_from", "2016/01/01"),
+        ("date_to", "2016-02-30"),
+    ],
+)
+def test_malformed_date(client, parameter, value):
+    response = client.get("/bookings/search/", params={parameter: value})
+    assert response.status_code == 400
+    assert parameter in response.json()["detail"]
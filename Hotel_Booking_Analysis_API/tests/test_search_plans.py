@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+
+from database import db_engine, search_filters, search_query
+
+# every combination of equality filters /bookings/search/ can apply,
+# and the lists and ranges, alone and in the combination the revenue reports use
+SEARCHES = [
+    {"guest_name": ["Jamie Smith"]},
+    {"guest_name": ["Jamie Smith"], "booking_date": ["2015-07-01"]},
+    {
+        "guest_name": ["Jamie Smith"],
+        "booking_date": ["2015-07-01"],
+        "length_of_stay": [1],
+    },
+    {"guest_name": ["Jamie Smith"], "length_of_stay": [1]},
+    {"booking_date": ["2015-07-01"]},
+    {"booking_date": ["2015-07-01"], "length_of_stay": [1]},
+    {"length_of_stay": [1]},
+    {"guest_name": ["Jamie Smith", "Anna Brown"]},
+    {"booking_date": ["2015-07-01", "2015-07-02"]},
+    {"length_of_stay": [1, 2]},
+    {"date_from": "2015-07-01", "date_to": "2015-08-01"},
+    {"min_stay": 3, "max_stay": 7},
+    {"min_rate": 50.0, "max_rate": 100.0},
+    {"date_from": "2015-07-01", "date_to": "2015-08-01", "min_stay": 3, "max_stay": 7},
+]
+
+
+@pytest.mark.parametrize("search", SEARCHES)
+def test_search_uses_an_index(client, search):
+    # the statement of the route, as it runs for the first page
+    query = search_query(search_filters(**search)).offset(0).limit(100)
+    with db_engine.connect() as connection:
+        sql = query.compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    details = [row.detail for row in plan]
+
+    # the bookings are found through an index, never by a scan of the table;
+    # lists and ranges then sort the matching bookings by id (USE TEMP B-TREE FOR ORDER BY)
+    assert any(
+        detail.startswith("SEARCH bookings USING INDEX") for detail in details
+    ), details
+    assert not any(detail.startswith("SCAN bookings") for detail in details), details
@@ -0,0 +1,26 @@
+from pandas.testing import assert_frame_equal
+
+import synthetic
+
+
+def test_rows_do_not_depend_on_the_split(monkeypatch):
+    monkeypatch.setattr(synthetic, "CHUNK_ROWS", 100)
+    full = synthetic.generate_bookings(250, seed=3)
+    for start, rows in [(0, 7), (5, 123), (95, 10), (210, 40)]:
+        part = synthetic.generate_bookings(rows, seed=3, start=start)
+        expected = full.iloc[start : start + rows].reset_index(drop=True)
+        assert_frame_equal(part, expected)
+
+
+def test_last_chunk_sized_to_the_rows(monkeypatch):
+    monkeypatch.setattr(synthetic, "CHUNK_ROWS", 100)
+    sizes = []
+    generate_chunk = synthetic._generate_chunk
+
+    def recording_generate_chunk(seed, chunk, size):
+        sizes.append(size)
+        return generate_chunk(seed, chunk, size)
+
+    monkeypatch.setattr(synthetic, "_generate_chunk", recording_generate_chunk)
+    assert len(synthetic.generate_bookings(30, start=150)) == 30
+    assert sizes == [80]